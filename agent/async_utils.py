@@ -1,13 +1,25 @@
 from __future__ import annotations
 
 import asyncio
+import atexit
+import contextvars
+import itertools
+import os
 import threading
-from typing import Any, Awaitable, Optional
+from typing import Any, Awaitable, List, Optional
 
 
-_loop: Optional[asyncio.AbstractEventLoop] = None
-_thread: Optional[threading.Thread] = None
+# 后台事件循环池：每个循环独占一个守护线程，run_coro_sync 轮询分配，
+# 避免所有同步调用方都挤在同一个循环上排队。
+_POOL_SIZE = max(1, min(os.cpu_count() or 1, 4))
+_loops: List[asyncio.AbstractEventLoop] = []
+_threads: List[threading.Thread] = []
 _lock = threading.Lock()
+_rr = itertools.count()
+# 调用方等待时在 timeout 之外额外给循环侧的 wait_for 留出取消/清理的时间
+_CANCEL_GRACE = 1.0
+# 线程本地的 asyncio.Runner：调用线程没有运行中的循环时直接在本线程跑协程，免去跨线程投递
+_local = threading.local()
 
 
 def _loop_worker(loop: asyncio.AbstractEventLoop) -> None:
@@ -15,35 +27,82 @@ def _loop_worker(loop: asyncio.AbstractEventLoop) -> None:
     loop.run_forever()
 
 
-def ensure_background_loop() -> asyncio.AbstractEventLoop:
-    global _loop, _thread
-    if _loop and _thread and _thread.is_alive():
-        return _loop
+def _pool_alive() -> bool:
+    return len(_threads) == _POOL_SIZE and all(t.is_alive() for t in _threads)
+
+
+def _ensure_pool() -> List[asyncio.AbstractEventLoop]:
+    if _pool_alive():
+        return _loops
     with _lock:
-        if _loop and _thread and _thread.is_alive():
-            return _loop
-        loop = asyncio.new_event_loop()
-        thread = threading.Thread(target=_loop_worker, args=(loop,), name="agent-bg-loop", daemon=True)
-        thread.start()
-        _loop = loop
-        _thread = thread
-        return loop
+        for i in range(_POOL_SIZE):
+            if i < len(_threads) and _threads[i].is_alive():
+                continue
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop_worker, args=(loop,), name=f"agent-bg-loop-{i}", daemon=True)
+            thread.start()
+            if i < len(_threads):
+                _loops[i] = loop
+                _threads[i] = thread
+            else:
+                _loops.append(loop)
+                _threads.append(thread)
+        return _loops
+
+
+def ensure_background_loop() -> asyncio.AbstractEventLoop:
+    """从后台循环池中轮询取一个循环（按需启动/重建）。"""
+    loops = _ensure_pool()
+    return loops[next(_rr) % len(loops)]
+
+
+def _thread_runner() -> asyncio.Runner:
+    runner = getattr(_local, "runner", None)
+    if runner is None:
+        runner = asyncio.Runner()
+        atexit.register(runner.close)
+        _local.runner = runner
+    return runner
 
 
-def run_coro_sync(awaitable: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+async def _as_coro(awaitable: Awaitable[Any]) -> Any:
+    return await awaitable
+
+
+def run_coro_sync(
+    awaitable: Awaitable[Any],
+    timeout: Optional[float] = None,
+    loop: Optional[asyncio.AbstractEventLoop] = None,
+) -> Any:
     """
-    在后台事件循环中运行协程，并在当前线程同步等待结果。
+    同步运行协程并等待结果。
+
+    - 未指定 loop 且当前线程没有运行中的事件循环（CLI 等一次性调用）：
+      用线程本地缓存的 asyncio.Runner 直接在本线程运行，无跨线程交接。
+    - 指定了 loop，或已处于异步上下文中（重入）：投递到后台事件循环并阻塞等待。
 
     注意：协程自身可实现超时控制；如需外部超时，可传入 timeout。
-    超时时会尝试取消底层协程。
+    传入 timeout 时在循环内用 asyncio.wait_for 包裹，超时即在循环侧取消协程并抛出 TimeoutError，
+    不会留下仍在后台运行的孤儿任务。
+    绑定到特定循环的资源（如 asyncio 子进程会话）需通过 loop 固定到创建它们的后台循环。
     """
-    loop = ensure_background_loop()
+    if timeout is not None:
+        awaitable = asyncio.wait_for(awaitable, timeout)
+    elif not asyncio.iscoroutine(awaitable):
+        awaitable = _as_coro(awaitable)
+
+    if loop is None:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # 以调用方当前上下文运行（Runner 默认复用其首次创建时的上下文快照）
+            return _thread_runner().run(awaitable, context=contextvars.copy_context())
+        loop = ensure_background_loop()
+
     fut = asyncio.run_coroutine_threadsafe(awaitable, loop)
     try:
-        return fut.result(timeout=timeout)
+        return fut.result(timeout=None if timeout is None else timeout + _CANCEL_GRACE)
     except TimeoutError:
         # 超时时取消底层的 Future，避免协程继续在后台运行
         fut.cancel()
         raise
-
-
@@ -15,6 +15,7 @@ if __name__ == "__main__":
         sys.path.insert(0, project_root)
 
 import argparse
+from collections import deque
 from typing import Dict, Any
 from agent.workflow import create_task_graph
 from agent.task_types import AgentState
@@ -35,30 +36,8 @@ def run(goal: str, recursion_limit: int = 100):
         "finished_titles": [],
     }
 
-    step = 1
-    def _extract_last_tool_call_args(messages):
-        """从消息中提取最近一次 run_instruction 的工具调用入参。"""
-        try:
-            for msg in reversed(messages or []):
-                tool_calls = getattr(msg, "tool_calls", None)
-                if not tool_calls:
-                    continue
-                for call in reversed(tool_calls):
-                    name = call.get("name") if isinstance(call, dict) else None
-                    if name == "run_instruction":
-                        args = call.get("args", {})
-                        return {
-                            "nl_instruction": args.get("nl_instruction"),
-                            "timeout": args.get("timeout"),
-                        }
-        except Exception:
-            pass
-        return {}
-
-    for event in agent.stream(initial_state, config={"recursion_limit": recursion_limit}):
-        for node_name, node_state in event.items():
-            pass
-        step += 1
+    # 逐事件的循环体为空：用 maxlen=0 的 deque 在 C 层消费整条事件流
+    deque(agent.stream(initial_state, config={"recursion_limit": recursion_limit}), maxlen=0)
 
 
 def main():
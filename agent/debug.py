@@ -1,51 +1,197 @@
 from __future__ import annotations
 
+import atexit
+import functools
 import json
+import os
+import re
+import threading
 import time
-from functools import wraps
-from typing import Any, Callable, Dict, List, Optional
+import types
+from functools import lru_cache
+from inspect import iscoroutinefunction
+from typing import IO, Any, Callable, Dict, List, Optional, Tuple, Union
 import contextvars
 
+# 可选依赖：装了 orjson 时用它序列化调试/状态日志，否则回退到标准库 json
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
 
-def _safe_serialize(obj: Any, limit: int = 800) -> str:
+
+# 调试开关：AGENT_DEBUG=1 时才启用 dispInfo 插桩与 .agent_debug.log 写入。
+# dispInfo 在装饰时读取；关闭时直接返回原函数，生产路径零包装开销。
+DEBUG_ENABLED = os.environ.get("AGENT_DEBUG", "0") == "1"
+
+# 控制台进度输出开关：SETUPAGENT_QUIET=1 时 debug.log 不输出（也不构造消息）
+VERBOSE = os.environ.get("SETUPAGENT_QUIET", "0") != "1"
+
+
+_SECRET_RE = re.compile(r"api_?key|password|token|secret", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def _is_secret(key: str) -> bool:
+    # 状态字典的键名高度重复，按键名缓存判定结果
+    return _SECRET_RE.search(key) is not None
+
+
+def _redact(value: Any) -> Any:
+    """返回脱敏副本（dict/list/tuple 递归复制，tuple 复制为 list，敏感键值替换为 "***"）。
+
+    使用显式工作栈代替递归，深层嵌套不产生逐层 Python 栈帧；
+    按 id 记录已复制的容器，环形引用复用同一副本而不会无限展开。
+    """
+    if not isinstance(value, (dict, list, tuple)):
+        return value
+    root: Any = {} if isinstance(value, dict) else []
+    copied: Dict[int, Any] = {id(value): root}
+    stack: List[Tuple[Any, Any]] = [(value, root)]
+
+    def _child(v: Any) -> Any:
+        if not isinstance(v, (dict, list, tuple)):
+            return v
+        dst = copied.get(id(v))
+        if dst is None:
+            dst = {} if isinstance(v, dict) else []
+            copied[id(v)] = dst
+            stack.append((v, dst))
+        return dst
+
+    while stack:
+        src, dst = stack.pop()
+        if isinstance(src, dict):
+            for k, v in src.items():
+                dst[k] = "***" if _is_secret(str(k)) else _child(v)
+        else:
+            dst.extend([_child(v) for v in src])
+    return root
+
+
+_encode_leaf = json.JSONEncoder(ensure_ascii=False).encode
+
+
+class _RedactingEncoder(json.JSONEncoder):
+    """边遍历边脱敏的 JSON 编码器：不再先 _redact 复制一整棵对象树再交给 json.dumps。
+
+    敏感键的值直接输出 "***"；非 JSON 类型按 str() 处理（等价于 default=str）。
+    """
+
+    def __init__(self) -> None:
+        super().__init__(ensure_ascii=False)
+
+    def default(self, o: Any) -> Any:
+        return str(o)
+
+    def iterencode(self, o: Any, _one_shot: bool = False):
+        if isinstance(o, dict):
+            if not o:
+                yield "{}"
+                return
+            yield "{"
+            first = True
+            for k, v in o.items():
+                if not first:
+                    yield ", "
+                first = False
+                if isinstance(k, str):
+                    key = k
+                elif k is None or isinstance(k, (bool, int, float)):
+                    key = _encode_leaf(k)
+                else:
+                    key = str(k)
+                yield _encode_leaf(key)
+                yield ": "
+                if _is_secret(key):
+                    yield '"***"'
+                else:
+                    yield from self.iterencode(v)
+            yield "}"
+        elif isinstance(o, (list, tuple)):
+            if not o:
+                yield "[]"
+                return
+            yield "["
+            first = True
+            for v in o:
+                if not first:
+                    yield ", "
+                first = False
+                yield from self.iterencode(v)
+            yield "]"
+        elif o is None or isinstance(o, (str, bool, int, float)):
+            yield _encode_leaf(o)
+        else:
+            yield _encode_leaf(self.default(o))
+
+
+_redacting_encoder = _RedactingEncoder()
+
+_ORJSON_OPTS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+
+def _dumps_redact(obj: Any) -> bytes:
+    """脱敏并完整编码为 UTF-8 JSON 字节（不截断的日志写入）；优先 orjson（对脱敏副本编码），失败或未安装时用流式编码器。"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(_redact(obj), default=str, option=_ORJSON_OPTS)
+        except Exception:
+            pass
+    return _redacting_encoder.encode(obj).encode("utf-8")
+
+
+def _safe_serialize_redact(obj: Any, limit: int = 800) -> str:
+    """脱敏并流式序列化，累计长度超过 limit 即停止。
+
+    不走 orjson：它要先构造完整的脱敏副本并编码全部内容再截断，大对象上远慢于提前停止的流式编码。
+    """
+    # 快路径：字符串（如 LLM 原始响应）原样截断输出，数字直接 str()，均无需走编码器
+    if isinstance(obj, str):
+        return obj if len(obj) <= limit else obj[:limit] + "…(截断)"
+    if type(obj) is int or type(obj) is float:
+        return str(obj)
+    parts: List[str] = []
+    size = 0
     try:
-        text = json.dumps(obj, ensure_ascii=False, default=str)
+        for chunk in _redacting_encoder.iterencode(obj):
+            parts.append(chunk)
+            size += len(chunk)
+            if size > limit:
+                break
+        text = "".join(parts)
     except Exception:
-        text = str(obj)
-    if isinstance(text, str) and len(text) > limit:
+        try:
+            text = str(_redact(obj))
+        except Exception:
+            text = f"<{type(obj).__name__}>"
+    if len(text) > limit:
         return text[:limit] + "…(截断)"
     return text
 
 
-def _redact(value: Any) -> Any:
-    if isinstance(value, dict):
-        redacted = {}
-        for k, v in value.items():
-            lk = str(k).lower()
-            if any(x in lk for x in ["api_key", "apikey", "password", "token", "secret"]):
-                redacted[k] = "***"
-            else:
-                redacted[k] = _redact(v)
-        return redacted
-    if isinstance(value, list):
-        return [_redact(v) for v in value]
-    return value
-
-
 class _CallRecord:
     def __init__(self, tag: str, func_name: str, args: tuple, kwargs: dict) -> None:
         self.tag = tag
         self.func_name = func_name
         self.args = args
         self.kwargs = kwargs
-        self.notes: List[Dict[str, Any]] = []
-        self.start_ts = time.time()
-        self.end_ts: Optional[float] = None
+        # (key, value) 元组：note() 每次只做一次 append，不再分配 dict
+        self.notes: List[Tuple[str, Any]] = []
+        # 单调时钟整数纳秒：仅用于计算耗时；人类可读时间戳在写日志时单独取
+        self.start_ns = time.monotonic_ns()
+        self.end_ns: Optional[int] = None
         self.return_value: Any = None
         self.exception: Optional[BaseException] = None
+        # 入栈时 set 返回的 token：出栈时据此还原到调用前的栈
+        self.token: Optional[contextvars.Token] = None
+
 
+# 调用栈为不可变元组，每次入栈 set 一个新元组：子任务/线程池拿到的上下文副本各自入栈出栈，互不串扰
+_stack_var: contextvars.ContextVar[Tuple[_CallRecord, ...]] = contextvars.ContextVar("_debug_stack", default=())
 
-_stack_var: contextvars.ContextVar[List[_CallRecord]] = contextvars.ContextVar("_debug_stack", default=[])
+
+_LOG_RULE = "-" * 60
 
 
 class DebugInfoManager:
@@ -56,68 +202,91 @@ class DebugInfoManager:
     - 在函数结束时统一打印本次调用的调试信息
     """
 
+    _log_path = ".agent_debug.log"
+
+    def __init__(self) -> None:
+        # 日志句柄惰性打开并常驻，每条记录写完即 flush：运行中日志实时可见，崩溃/强杀时也不丢尾部
+        self._log_fh: Optional[IO[str]] = None
+        self._log_lock = threading.Lock()
+        self.verbose = VERBOSE
+        # 调用方可据此跳过只为 note() 准备的切片/格式化
+        self.enabled = DEBUG_ENABLED
+
+    def _get_log_fh(self) -> IO[str]:
+        if self._log_fh is None:
+            fh = open(self._log_path, "a", encoding="utf-8")
+            atexit.register(fh.close)
+            self._log_fh = fh
+        return self._log_fh
+
     def start(self, tag: str, func_name: str, args: tuple, kwargs: dict) -> None:
-        stack = list(_stack_var.get())
-        stack.append(_CallRecord(tag, func_name, args, kwargs))
-        _stack_var.set(stack)
+        rec = _CallRecord(tag, func_name, args, kwargs)
+        rec.token = _stack_var.set(_stack_var.get() + (rec,))
 
     def note(self, key: str, value: Any) -> None:
         stack = _stack_var.get()
         if not stack:
             return
-        stack[-1].notes.append({"key": key, "value": value})
+        stack[-1].notes.append((key, value))
 
     def end(self, return_value: Any = None, exception: Optional[BaseException] = None) -> None:
-        stack = list(_stack_var.get())
+        stack = _stack_var.get()
         if not stack:
             return
-        rec = stack.pop()
-        _stack_var.set(stack)
+        rec = stack[-1]
+        try:
+            _stack_var.reset(rec.token)  # type: ignore[arg-type]
+        except (ValueError, RuntimeError):
+            # token 来自其他上下文（或已被使用）时退化为直接出栈
+            _stack_var.set(stack[:-1])
+        # 运行时关闭：仍需出栈保持平衡，但跳过脱敏/序列化/写文件
+        if not DEBUG_ENABLED:
+            return
 
-        rec.end_ts = time.time()
+        rec.end_ns = time.monotonic_ns()
         rec.return_value = return_value
         rec.exception = exception
 
-        # 构建日志内容
-        duration_ms = int((rec.end_ts - rec.start_ts) * 1000) if rec.end_ts else -1
-        lines = [f"=== 调试 · {rec.tag} · {rec.func_name} · {duration_ms}ms ==="]
+        # 构建日志内容：头部（时间戳 + 标题）一次 f-string 生成，各段收集后统一 join
+        duration_ms = (rec.end_ns - rec.start_ns) // 1_000_000
+        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        parts = [f"\n[{ts}]\n=== 调试 · {rec.tag} · {rec.func_name} · {duration_ms}ms ==="]
 
         # 只输出kwargs（args通常为空或不重要）
-        safe_kwargs = _redact(rec.kwargs)
-        if safe_kwargs:
-            lines.append(f"入参: {_safe_serialize(safe_kwargs, limit=400)}")
+        if rec.kwargs:
+            parts.append(f"入参: {_safe_serialize_redact(rec.kwargs, limit=400)}")
 
         if rec.notes:
-            lines.append("关键信息:")
-            for n in rec.notes:
-                key = n.get('key', '')
-                # 跳过prompt（太长且无用）
-                if 'prompt' in key.lower():
-                    continue
-                val = n.get('value')
-                # 对raw_resp等响应类信息，限制在200字符
-                limit = 200 if 'resp' in key.lower() else 300
-                lines.append(f"  • {key}: {_safe_serialize(_redact(val), limit=limit)}")
+            parts.append("关键信息:")
+            # 跳过prompt（太长且无用）；对raw_resp等响应类信息，限制在200字符
+            parts.extend(
+                f"  • {key}: {_safe_serialize_redact(val, limit=200 if 'resp' in lk else 300)}"
+                for key, val, lk in ((k, v, k.lower()) for k, v in rec.notes)
+                if "prompt" not in lk
+            )
 
         if rec.exception is not None:
-            lines.append(f"❌ 异常: {type(rec.exception).__name__}: {rec.exception}")
+            parts.append(f"❌ 异常: {type(rec.exception).__name__}: {rec.exception}\n{_LOG_RULE}\n")
         else:
             # 对返回值进行精简，特别是JSON字符串
-            ret_str = _safe_serialize(_redact(rec.return_value), limit=500)
-            lines.append(f"✓ 返回: {ret_str}")
-        lines.append("-" * 60)
-        
+            parts.append(f"✓ 返回: {_safe_serialize_redact(rec.return_value, limit=500)}\n{_LOG_RULE}\n")
+        record = "\n".join(parts)
+
         # 写入文件
         try:
-            ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-            with open(".agent_debug.log", "a", encoding="utf-8") as f:
-                f.write(f"\n[{ts}]\n")
-                f.write("\n".join(lines))
-                f.write("\n")
+            with self._log_lock:
+                fh = self._get_log_fh()
+                fh.write(record)
+                fh.flush()
         except Exception:
             # 如果文件写入失败，回退到控制台输出
-            for line in lines:
-                print(line)
+            print(record, end="")
+
+    # 控制台进度输出：message 可为字符串或无参函数；静默时直接返回，函数不会被调用
+    def log(self, message: Union[str, Callable[[], str]]) -> None:
+        if not self.verbose:
+            return
+        print(message() if callable(message) else message)
 
     # 追加：将任意对象（如完整 state）以 JSON 形式写入日志文件
     def write_json_log(self, payload: Any, file_path: Optional[str] = None) -> None:
@@ -125,18 +294,64 @@ class DebugInfoManager:
             # 默认日志文件：.agent_state.log 放在当前工作目录
             target = file_path or ".agent_state.log"
             # 尽量保留原始对象，但要做脱敏与可序列化处理
-            redacted = _redact(payload)
-            text = json.dumps(redacted, ensure_ascii=False, default=str)
+            data = _dumps_redact(payload)
             ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-            with open(target, "a", encoding="utf-8") as f:
-                f.write(f"[{ts}] ")
-                f.write(text)
-                f.write("\n")
+            # 二进制追加：编码结果已是 UTF-8 字节，省去文本层再编码
+            with open(target, "ab") as f:
+                f.write(b"".join((f"[{ts}] ".encode("utf-8"), data, b"\n")))
         except Exception:
             # 不因日志失败影响主流程
             pass
 
 
+class _SyncDebugWrapper:
+    # 单个可调用对象承担同步函数的包装：不再为每个被装饰函数生成闭包，也不走 functools.wraps。
+    # 保留 __wrapped__/__annotations__，使 inspect.signature 与 langchain 的 @tool 仍能推断参数。
+    __slots__ = ("func", "tag", "__wrapped__", "__name__", "__qualname__", "__doc__", "__annotations__")
+
+    def __init__(self, func: Callable[..., Any], tag: str) -> None:
+        self.func = func
+        self.tag = tag
+        self.__wrapped__ = func
+        self.__name__ = func.__name__
+        self.__qualname__ = getattr(func, "__qualname__", func.__name__)
+        self.__doc__ = func.__doc__
+        self.__annotations__ = getattr(func, "__annotations__", {})
+
+    def __call__(self, *args, **kwargs):
+        debug.start(self.tag, self.__name__, args, kwargs)
+        try:
+            rv = self.func(*args, **kwargs)
+            debug.end(rv, None)
+            return rv
+        except BaseException as e:
+            debug.end(None, e)
+            raise
+
+    def __get__(self, obj: Any, objtype: Any = None) -> Any:
+        # 装饰方法时按描述符协议绑定 self
+        if obj is None:
+            return self
+        return types.MethodType(self, obj)
+
+
+def _async_debug_wrapper(func: Callable[..., Any], tag: str) -> Callable[..., Any]:
+    # 异步函数保留真正的 async def 闭包：inspect.iscoroutinefunction 为 True，
+    # LangGraph/RunnableLambda 据此识别异步实现
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        debug.start(tag, func.__name__, args, kwargs)
+        try:
+            rv = await func(*args, **kwargs)
+            debug.end(rv, None)
+            return rv
+        except BaseException as e:
+            debug.end(None, e)
+            raise
+
+    return wrapper
+
+
 def dispInfo(tag: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
     """
     调试信息装饰器：
@@ -145,37 +360,14 @@ def dispInfo(tag: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
     - 函数结束时统一打印完整调试信息
     """
 
-    def _decorator(func: Callable[..., Any]) -> Callable[..., Any]:
-        @wraps(func)
-        def _sync_wrapper(*args, **kwargs):
-            debug.start(tag, func.__name__, args, kwargs)
-            try:
-                rv = func(*args, **kwargs)
-                debug.end(rv, None)
-                return rv
-            except BaseException as e:
-                debug.end(None, e)
-                raise
+    if not DEBUG_ENABLED:
+        return lambda func: func
 
+    def _decorator(func: Callable[..., Any]) -> Callable[..., Any]:
         # 兼容 async 函数：如果 func 是协程函数，则返回异步包装器
-        try:
-            import inspect
-            if inspect.iscoroutinefunction(func):
-                @wraps(func)
-                async def _async_wrapper(*args, **kwargs):
-                    debug.start(tag, func.__name__, args, kwargs)
-                    try:
-                        rv = await func(*args, **kwargs)
-                        debug.end(rv, None)
-                        return rv
-                    except BaseException as e:
-                        debug.end(None, e)
-                        raise
-                return _async_wrapper  # type: ignore[return-value]
-        except Exception:
-            pass
-
-        return _sync_wrapper
+        if iscoroutinefunction(func):
+            return _async_debug_wrapper(func, tag)
+        return _SyncDebugWrapper(func, tag)
 
     return _decorator
 
@@ -1,13 +1,29 @@
 from __future__ import annotations
 
-from typing import TypedDict, List, Dict, Any, Optional
+import ast
+import asyncio
+import os
+import re
+import sqlite3
+from functools import lru_cache
+from typing import Annotated, Callable, TypedDict, List, Dict, Any, Optional
 
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
-
-from utils import llm_completion
+from langchain_core.runnables import RunnableLambda
+
+from utils import (
+    llm_completion,
+    llm_acompletion,
+    json_dumps,
+    cached_llm_completion_streamed,
+    cached_llm_acompletion_streamed,
+    llm_cache_stats,
+)
+from agent.async_utils import run_coro_sync
 from agent.debug import dispInfo, debug
 from agent.message_utils import make_generic_tool_call_message, extract_last_tool_result
+from tools.base import parse_tool_dict, parse_tool_response
 from tools import (
     FILES_EXISTS_TOOL,
     FILES_STAT_TOOL,
@@ -24,27 +40,103 @@ from tools import (
     GIT_REPO_STATUS_TOOL,
 )
 
+# facts 提取是尽力而为：observer 不可用时 observe_node 只跳过 facts_delta，不影响主循环
+try:
+    from agent.observer import observe_v2
+except ImportError:
+    observe_v2 = None  # type: ignore[assignment]
+
+
+_PATCH_LAST = "_patch_last"
+
+
+def _merge_transcript(left: List[Dict[str, Any]], right: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Reducer for transcript: append new turns; a {_PATCH_LAST: {...}} entry updates the last turn.
+
+    The patched turn is rebuilt as a new dict, so earlier checkpoints never see it mutated.
+    """
+    merged = list(left or [])
+    for entry in right or []:
+        patch = entry.get(_PATCH_LAST) if isinstance(entry, dict) else None
+        if patch is None:
+            merged.append(entry)
+        elif merged:
+            merged[-1] = {**merged[-1], **patch}
+    return merged
+
+
+# Bounded working set carried through state: prompt building and summarization never touch the
+# full (archival) transcript, so their cost stays constant regardless of how many turns ran.
+_CTX_WINDOW = 12
+_PROMPT_TURNS = 6
+
+
+def _merge_window(left: List[Dict[str, Any]], right: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Reducer for ctx_window: same append/patch rules as transcript, keeping only the last _CTX_WINDOW turns."""
+    return _merge_transcript(left, right)[-_CTX_WINDOW:]
+
+
+def _merge_blocks(left: List[str], right: List[str]) -> List[str]:
+    """Reducer for turn_cache: keep the formatted blocks of the last _PROMPT_TURNS completed turns."""
+    return ((left or []) + (right or []))[-_PROMPT_TURNS:]
+
+
+_TOOL_CACHE_SIZE = 64
+
+
+def _merge_tool_cache(left: Dict[str, str], right: Dict[str, str]) -> Dict[str, str]:
+    """Reducer for tool_cache: LRU by insertion order (re-emitted keys move to the end), capped at _TOOL_CACHE_SIZE."""
+    merged = dict(left or {})
+    for key, value in (right or {}).items():
+        merged.pop(key, None)
+        merged[key] = value
+    while len(merged) > _TOOL_CACHE_SIZE:
+        del merged[next(iter(merged))]
+    return merged
+
+
+def _merge_facts(left: Dict[str, Any], right: Dict[str, Any]) -> Dict[str, Any]:
+    """Reducer for facts: merge the delta, then normalize minimal expected keys."""
+    facts = {**(left or {}), **(right or {})}
+    if "repo_path" in facts and not facts.get("repo_root"):
+        facts["repo_root"] = facts.pop("repo_path")
+    if facts.get("repo_root") and not facts.get("exec_root"):
+        facts["exec_root"] = facts["repo_root"]
+    facts.pop("work_dir", None)
+    return facts
+
 
 class DiscoverState(TypedDict, total=False):
     """State for the standalone ReAct discover agent.
 
     Fields:
     - goal: discovery goal text
-    - messages: LangChain-style message list for ToolNode routing
-    - transcript: list of {thought, action, observation} for human-readable trace
+    - messages: LangChain-style message list for ToolNode routing (last write wins; nodes emit only new messages)
+    - transcript: list of {thought, action, observation} for human-readable trace (append reducer, archival)
+    - ctx_window: the last 12 transcript turns, used for summarization (bounded reducer)
     - summary: final natural-language plan/understanding
     - finished: whether the agent decided to stop
-    - facts: optional scratch facts accumulated during discovery (best-effort)
+    - facts: optional scratch facts accumulated during discovery (best-effort; nodes emit deltas)
     - route: internal routing hint for graph edges
+    - turn_cache: formatted prompt blocks of the last 6 completed turns (bounded reducer, each built once)
+    - tool_cache: observation of each successful (tool, args) call in this run (LRU reducer, 64 entries)
+    - pending_tool_key: tool_cache key of the call currently sent to ToolNode
+
+    Nodes return only the keys they change; list/dict fields are merged by their reducers instead
+    of being copied and rewritten by every node.
     """
 
     goal: str
     messages: List[dict]
-    transcript: List[Dict[str, Any]]
+    transcript: Annotated[List[Dict[str, Any]], _merge_transcript]
+    ctx_window: Annotated[List[Dict[str, Any]], _merge_window]
     summary: str
     finished: bool
-    facts: Dict[str, Any]
+    facts: Annotated[Dict[str, Any], _merge_facts]
     route: str
+    turn_cache: Annotated[List[str], _merge_blocks]
+    tool_cache: Annotated[Dict[str, str], _merge_tool_cache]
+    pending_tool_key: str
 
 
 SYSTEM_PROMPT = (
@@ -74,27 +166,56 @@ def _truncate(text: str, n: int = 1200) -> str:
     return (text or "")[:n]
 
 
+_REACT_TAIL = "\n请基于以上信息继续：只输出一段 Thought 和一行 Action。"
+
+
+@lru_cache(maxsize=32)
+def _react_prefix(goal: str) -> str:
+    # SYSTEM_PROMPT 不变，目标在一次运行中也不变：前缀按 goal 只拼一次
+    return f"{SYSTEM_PROMPT}\nGoal: {goal}\n"
+
+
+def _format_turn(turn: Dict[str, Any]) -> str:
+    th = str(turn.get("thought", "")).strip()
+    ac = str(turn.get("action", "")).strip()
+    ob = str(turn.get("observation", "")).strip()
+    lines: List[str] = []
+    if th:
+        lines.append(f"Thought: {th}")
+    if ac:
+        lines.append(f"Action: {ac}")
+    if ob:
+        # Observation is already smart and concise from observe_node
+        lines.append(f"Observation: {_truncate(ob, 1500)}")
+    return "\n".join(lines)
+
+
 def _build_react_prompt(state: DiscoverState) -> str:
-    goal = state.get("goal", "")
-    transcript = state.get("transcript", [])
-    ctx_lines: List[str] = [SYSTEM_PROMPT]
-    ctx_lines.append(f"Goal: {goal}\n")
-
-    # Add short transcript context (last few turns)
-    for turn in transcript[-6:]:
-        th = str(turn.get("thought", "")).strip()
-        ac = str(turn.get("action", "")).strip()
-        ob = str(turn.get("observation", "")).strip()
-        if th:
-            ctx_lines.append(f"Thought: {th}")
-        if ac:
-            ctx_lines.append(f"Action: {ac}")
-        if ob:
-            # Observation is already smart and concise from observe_node
-            ctx_lines.append(f"Observation: {_truncate(ob, 1500)}")
+    # Add short transcript context (last few turns): blocks were formatted once when each turn completed
+    ctx = [_react_prefix(state.get("goal", ""))]
+    ctx.extend(b for b in (state.get("turn_cache") or [])[-_PROMPT_TURNS:] if b)
+    ctx.append(_REACT_TAIL)
+    return "\n".join(ctx)
+
+
+_CALL_RE = re.compile(r"([a-zA-Z_][\w]*)\s*\((.*)\)\s*$", re.DOTALL)
+_KV_RE = re.compile(r"""([A-Za-z_]\w*)\s*=\s*("[^"]*"|'[^']*'|[^,]*)\s*(?:,|$)""")
+
 
-    ctx_lines.append("\n请基于以上信息继续：只输出一段 Thought 和一行 Action。")
-    return "\n".join(ctx_lines)
+_FINISH_WORDS = frozenset(("done", "no more actions"))
+_HEAD_LEN = 16
+
+
+def _coerce_arg(val: str) -> Any:
+    # Quoted strings: strip the quotes without literal_eval so backslashes stay literal
+    # (file_read(path="C:\a\b.md") must not turn \a / \b into control characters)
+    if len(val) >= 2 and val[0] == val[-1] and val[0] in ('"', "'"):
+        return val[1:-1]
+    try:
+        # Try literal_eval for numbers, booleans, lists, etc.
+        return ast.literal_eval(val)
+    except Exception:
+        return val
 
 
 def _parse_action(line: str) -> Dict[str, Any]:
@@ -109,133 +230,114 @@ def _parse_action(line: str) -> Dict[str, Any]:
         return {"type": "invalid"}
     
     # Normalize prefix: remove multiple "Action:" prefixes
-    while text.lower().startswith("action:"):
-        text = text.split(":", 1)[1].strip()
-    
-    # Finish
-    if text.lower().startswith("finish") or text.lower() in ("done", "no more actions"):
+    # 前缀判断只需看开头，按短前缀做小写，不对整行（可能很长的参数）反复 lower()
+    head = text[:_HEAD_LEN].lower()
+    while head.startswith("action:"):
+        text = text[7:].strip()
+        head = text[:_HEAD_LEN].lower()
+
+    # Finish: finish / finish() / finish(...) 直接返回，不进入正则与参数解析
+    if head.startswith("finish") or (len(text) < _HEAD_LEN and head in _FINISH_WORDS):
         return {"type": "finish"}
 
     # ToolName(args)
-    import re
-    m = re.match(r"([a-zA-Z_][\w]*)\s*\((.*)\)\s*$", text, re.DOTALL)
+    m = _CALL_RE.match(text)
     if not m:
         return {"type": "invalid"}
     name = m.group(1)
     args_src = m.group(2).strip()
     kwargs: Dict[str, Any] = {}
-    
+
     if args_src:
-        # Parse kwargs manually to handle Windows paths better
-        # Split by commas outside quotes
-        import shlex
-        try:
-            # Use a simple key=value parser
-            pairs = []
-            current = ""
-            in_quote = False
-            quote_char = None
-            
-            for char in args_src:
-                if char in ('"', "'") and (not in_quote or char == quote_char):
-                    in_quote = not in_quote
-                    quote_char = char if in_quote else None
-                    current += char
-                elif char == ',' and not in_quote:
-                    if current.strip():
-                        pairs.append(current.strip())
-                    current = ""
-                else:
-                    current += char
-            if current.strip():
-                pairs.append(current.strip())
-            
-            # Parse each key=value pair
-            for pair in pairs:
-                if '=' not in pair:
-                    continue
-                key, val = pair.split('=', 1)
-                key = key.strip()
-                val = val.strip()
-                
-                # Evaluate value
-                try:
-                    # Try literal_eval for numbers, booleans, lists, etc.
-                    import ast
-                    kwargs[key] = ast.literal_eval(val)
-                except Exception:
-                    # Fallback: strip quotes if present, otherwise use as-is
-                    if (val.startswith('"') and val.endswith('"')) or (val.startswith("'") and val.endswith("'")):
-                        kwargs[key] = val[1:-1]
-                    else:
-                        kwargs[key] = val
-        except Exception:
-            # If all parsing fails, return empty args
-            kwargs = {}
-    
+        # 一次正则扫描切出 key=value：引号内的逗号不分割，反斜杠按字面保留（兼容 Windows 路径）
+        for key, val in _KV_RE.findall(args_src):
+            kwargs[key] = _coerce_arg(val.strip())
+
     return {"type": "tool", "name": name, "args": kwargs}
 
 
-@dispInfo("discover_react")
-def react_node(state: DiscoverState) -> DiscoverState:
-    """LLM-driven step: produce next Thought + Action. If Action is a tool call,
-    enqueue a ToolNode request. If finish, route to summarize.
+_ACTION_DONE_RE = re.compile(r"^[ \t]*action:[^\n]*\n", re.IGNORECASE | re.MULTILINE)
+
+
+def _action_line_done(text: str) -> bool:
+    """Streaming stop condition: a full "Action: ..." line (terminated by newline) has arrived.
+
+    _react_apply only uses the first Thought line and the first Action line, so anything after is discarded anyway.
     """
-    # Build prompt from transcript (observations already processed by observe_node)
+    return _ACTION_DONE_RE.search(text) is not None
+
+
+def _prompt_context_text(transcript: List[Dict[str, Any]]) -> str:
+    lines = [f"\n[Prompt Context - Turn {len(transcript)}]", f"Transcript entries: {len(transcript)}"]
+    if transcript:
+        last = transcript[-1]
+        lines.append(f"Last action: {last.get('action', '')[:80]}")
+        lines.append(f"Last observation: {str(last.get('observation', ''))[:150]}...")
+    return "\n".join(lines)
+
+
+def _tool_result_text(tool_name: str, ok: bool, data: Any, error: Optional[str]) -> str:
+    data_str = json_dumps(data)
+    lines = ["[Tool Result]", f"  Tool: {tool_name}", f"  OK: {ok}"]
+    lines.append(f"  Data: {data_str[:300]}..." if len(data_str) > 300 else f"  Data: {data_str}")
+    if error:
+        lines.append(f"  Error: {error}")
+    return "\n".join(lines)
+
+
+def _react_prepare(state: DiscoverState) -> str:
+    """Shared by react_node / react_node_async: build the prompt and print periodic context."""
+    # Build prompt from the cached turn blocks (observations already processed by observe_node)
     prompt = _build_react_prompt(state)
-    
+
     # Debug: show prompt context (first time and every 5 turns)
     transcript = state.get("transcript", [])
     if len(transcript) == 0 or len(transcript) % 5 == 0:
-        print(f"\n[Prompt Context - Turn {len(transcript)}]")
-        print(f"Transcript entries: {len(transcript)}")
-        if transcript:
-            last = transcript[-1]
-            print(f"Last action: {last.get('action', '')[:80]}")
-            print(f"Last observation: {str(last.get('observation', ''))[:150]}...")
+        debug.log(lambda: _prompt_context_text(transcript))
+    return prompt
+
+
+def _tool_key(tool_name: str, tool_args: Dict[str, Any]) -> str:
+    return f"{tool_name}:{sorted(tool_args.items())!r}"
 
-    model_out = llm_completion(prompt, temperature=0.2, max_tokens=400).strip()
 
+def _react_apply(state: DiscoverState, model_out: str) -> DiscoverState:
+    """Shared by react_node / react_node_async: turn the model output into the next state."""
     # Split out Thought and Action lines (best-effort)
     thought = ""
     action_line = ""
-    for line in model_out.splitlines():
-        if not thought and line.strip().lower().startswith("thought:"):
+    lines = model_out.splitlines()
+    for line in lines:
+        stripped = line.strip()
+        low = stripped.lower()
+        if not thought and low.startswith("thought:"):
             thought = line.split(":", 1)[1].strip()
-        if not action_line and line.strip().lower().startswith("action:"):
-            action_line = line.strip()
+        elif not action_line and low.startswith("action:"):
+            action_line = stripped
+        if thought and action_line:
+            break
     if not action_line:
         # Heuristic: try to find a tool-like pattern
-        for line in model_out.splitlines():
+        for line in lines:
             if "(" in line and ")" in line:
                 action_line = "Action: " + line.strip()
                 break
 
     # Print LLM decision
-    print(f"\n{'='*80}")
-    print(f"[LLM Decision]")
-    print(f"Thought: {thought}")
-    print(f"Action: {action_line}")
-    print(f"{'='*80}")
+    debug.log(lambda: f"\n{'='*80}\n[LLM Decision]\nThought: {thought}\nAction: {action_line}\n{'='*80}")
 
     parsed = _parse_action(action_line)
-    print(f"[Parsed] Type: {parsed.get('type')}, Name: {parsed.get('name')}, Args: {parsed.get('args')}")
+    debug.log(lambda: f"[Parsed] Type: {parsed.get('type')}, Name: {parsed.get('name')}, Args: {parsed.get('args')}")
 
-    # Update transcript with Thought and Action (observation appended after tools run)
-    transcript = list(state.get("transcript", []))
-    transcript.append({"thought": thought, "action": action_line})
-
-    messages = list(state.get("messages", []))
+    # New transcript turn with Thought and Action (observation patched in after tools run)
+    turn: Dict[str, Any] = {"thought": thought, "action": action_line}
+    update: DiscoverState = {"transcript": [turn], "ctx_window": [turn]}
     route = "react"
 
     if parsed.get("type") == "finish":
         # Finish the loop
-        return {
-            **state,
-            "messages": messages,
-            "transcript": transcript,
-            "route": "summarize",
-        }
+        update["route"] = "summarize"
+        return update
 
     if parsed.get("type") == "tool":
         tool_name = str(parsed.get("name", "")).strip()
@@ -256,155 +358,193 @@ def react_node(state: DiscoverState) -> DiscoverState:
             "pyenv_parse_pyproject",
             "git_repo_status",
         }
-        if tool_name in allowed:
+        tool_key = _tool_key(tool_name, tool_args)
+        cached = (state.get("tool_cache") or {}).get(tool_key) if tool_name in allowed else None
+        if cached is not None:
+            # Read-only tools over an unchanged workspace: reuse the earlier observation, skip execute/observe
+            debug.log(lambda: f"[Tool Cache] {tool_name}({tool_args})")
+            turn["observation"] = cached
+            update["tool_cache"] = {tool_key: cached}
+            route = "react"
+        elif tool_name in allowed:
             try:
-                print(f"[Tool Call] {tool_name}({tool_args})")
-                messages.append(make_generic_tool_call_message(tool_name, tool_args))
+                debug.log(lambda: f"[Tool Call] {tool_name}({tool_args})")
+                # ToolNode only reads the last message: emit just the new tool call
+                update["messages"] = [make_generic_tool_call_message(tool_name, tool_args)]
+                update["pending_tool_key"] = tool_key
                 route = "execute"
             except Exception:
                 # Could not enqueue tool; record as observation and continue
-                transcript[-1]["observation"] = f"enqueue_error: {tool_name}"
+                turn["observation"] = f"enqueue_error: {tool_name}"
                 route = "react"
         else:
             # Unsupported/mutating action: reflect and continue
-            print(f"[Blocked] Unsupported action: {tool_name}")
-            transcript[-1]["observation"] = f"unsupported_action: {tool_name}"
+            debug.log(lambda: f"[Blocked] Unsupported action: {tool_name}")
+            turn["observation"] = f"unsupported_action: {tool_name}"
             route = "react"
     else:
-        transcript[-1]["observation"] = "invalid_action"
+        turn["observation"] = "invalid_action"
         route = "react"
 
-    return {**state, "messages": messages, "transcript": transcript, "route": route}
+    if route == "react":
+        # The turn is already complete (observation set above): format its prompt block now
+        update["turn_cache"] = [_format_turn(turn)]
+    update["route"] = route
+    return update
+
+
+@dispInfo("discover_react")
+def react_node(state: DiscoverState) -> DiscoverState:
+    """LLM-driven step: produce next Thought + Action. If Action is a tool call,
+    enqueue a ToolNode request. If finish, route to summarize.
+    """
+    prompt = _react_prepare(state)
+    model_out = cached_llm_completion_streamed(prompt, stop=_action_line_done, tier="fast", temperature=0.2, max_tokens=400).strip()
+    debug.note("llm_cache", llm_cache_stats())
+    return _react_apply(state, model_out)
+
+
+@dispInfo("discover_react")
+async def react_node_async(state: DiscoverState) -> DiscoverState:
+    """Async variant of react_node used by ainvoke: awaits the LLM instead of blocking."""
+    prompt = _react_prepare(state)
+    model_out = (
+        await cached_llm_acompletion_streamed(prompt, stop=_action_line_done, tier="fast", temperature=0.2, max_tokens=400)
+    ).strip()
+    debug.note("llm_cache", llm_cache_stats())
+    return _react_apply(state, model_out)
+
+
+# files_list 观察中需要突出显示的关键文件（小写文件名）
+_KEY_FILES = frozenset(("pyproject.toml", "setup.py", "requirements.txt", "readme.md", "readme", "setup.cfg"))
+
+
+# Per-tool observation formatters: tool result data -> concise observation for the LLM.
+# New tools register here instead of extending observe_node.
+def _fmt_files_read(data: Dict[str, Any]) -> str:
+    content = data.get("content", "")
+    size = data.get("size", len(content))
+    truncated = data.get("truncated", False)
+    path = data.get("path", "")
+    return f"已读取文件 {path}（共 {size} 字符）{'[被截断]' if truncated else '[完整]'}:\n{content}"
+
+
+def _fmt_files_list(data: Dict[str, Any]) -> str:
+    entries = data.get("entries", [])
+    dir_path = data.get("dir", "")
+
+    # Categorize entries for better readability
+    key_files = []  # Important config files
+    py_files = []
+    dirs = []
+    others = []
+
+    for e in entries:
+        name = e.get("name", "")
+        etype = e.get("type", "file")
+
+        # Highlight key files
+        if name.lower() in _KEY_FILES:
+            key_files.append(f"{name} [{etype}]")
+        elif name.endswith(".py"):
+            py_files.append(name)
+        elif etype == "dir":
+            dirs.append(name + "/")
+        else:
+            others.append(name)
+
+    # Build hierarchical observation
+    parts = [f"目录 {dir_path} 包含 {len(entries)} 项:"]
+    if key_files:
+        parts.append(f"  关键文件: {', '.join(key_files)}")
+    if dirs:
+        parts.append(f"  子目录({len(dirs)}): {', '.join(dirs[:10])}{'...' if len(dirs) > 10 else ''}")
+    if py_files:
+        parts.append(f"  Python文件({len(py_files)}): {', '.join(py_files[:8])}{'...' if len(py_files) > 8 else ''}")
+    if others and len(others) <= 15:
+        parts.append(f"  其他: {', '.join(others)}")
+
+    return "\n".join(parts)
+
+
+def _fmt_files_exists(data: Dict[str, Any]) -> str:
+    exists = data.get("exists", False)
+    path = data.get("path", "")
+    return f"文件 {path} {'存在' if exists else '不存在'}"
+
+
+def _fmt_pyproject(data: Dict[str, Any]) -> str:
+    if not data.get("exists", False):
+        return f"pyproject.toml 不存在于 {data.get('path', '')}"
+    deps = data.get("dependencies", [])
+    name = data.get("project_name", "")
+    return f"项目 {name}，依赖 {len(deps)} 个包: {', '.join(deps[:10])}{'...' if len(deps) > 10 else ''}"
+
+
+def _fmt_default(data: Dict[str, Any]) -> str:
+    # Fallback: compact JSON
+    return json_dumps(data)[:800]
+
+
+_OBSERVATION_FORMATTERS: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    "files_read": _fmt_files_read,
+    "files_list": _fmt_files_list,
+    "files_exists": _fmt_files_exists,
+    "pyenv_parse_pyproject": _fmt_pyproject,
+}
 
 
 @dispInfo("discover_react")
 def observe_node(state: DiscoverState) -> DiscoverState:
     """After ToolNode runs, capture the latest observation into transcript, then loop back."""
-    transcript = list(state.get("transcript", []))
     last = extract_last_tool_result(state.get("messages", []))
     
     # Build a smart, concise observation for the LLM (not truncated)
     llm_observation = ""
+    ok = False
     if last:
-        import json
-        from tools.base import parse_tool_response
-        parsed = parse_tool_response(json.dumps(last) if isinstance(last, dict) else str(last))
+        parsed = parse_tool_dict(last) if isinstance(last, dict) else parse_tool_response(str(last))
         tool_name = parsed.get('tool', 'unknown')
         ok = parsed.get('ok', False)
         data = parsed.get('data', {})
         error = parsed.get('error')
         
-        # Print full result for debugging
-        print(f"[Tool Result]")
-        print(f"  Tool: {tool_name}")
-        print(f"  OK: {ok}")
-        data_str = json.dumps(data, ensure_ascii=False)
-        if len(data_str) > 300:
-            print(f"  Data: {data_str[:300]}...")
-        else:
-            print(f"  Data: {data_str}")
-        if error:
-            print(f"  Error: {error}")
+        # Print full result for debugging (data is only serialized when console output is on)
+        debug.log(lambda: _tool_result_text(tool_name, ok, data, error))
         
         # Build smart observation for LLM (full context, not truncated)
         if not ok:
             llm_observation = f"工具 {tool_name} 失败: {error or '未知错误'}"
-        elif tool_name == "files_read":
-            content = data.get("content", "")
-            size = data.get("size", len(content))
-            truncated = data.get("truncated", False)
-            path = data.get("path", "")
-            llm_observation = f"已读取文件 {path}（共 {size} 字符）{'[被截断]' if truncated else '[完整]'}:\n{content}"
-        elif tool_name == "files_list":
-            entries = data.get("entries", [])
-            truncated = data.get("truncated", False)
-            dir_path = data.get("dir", "")
-            
-            # Categorize entries for better readability 
-            key_files = []  # Important config files
-            py_files = []
-            dirs = []
-            others = []
-            
-            for e in entries:
-                name = e.get("name", "")
-                etype = e.get("type", "file")
-                
-                # Highlight key files
-                if name.lower() in ("pyproject.toml", "setup.py", "requirements.txt", "readme.md", "readme", "setup.cfg"):
-                    key_files.append(f"{name} [{etype}]")
-                elif name.endswith(".py"):
-                    py_files.append(name)
-                elif etype == "dir":
-                    dirs.append(name + "/")
-                else:
-                    others.append(name)
-            
-            # Build hierarchical observation
-            parts = [f"目录 {dir_path} 包含 {len(entries)} 项:"]
-            if key_files:
-                parts.append(f"  关键文件: {', '.join(key_files)}")
-            if dirs:
-                parts.append(f"  子目录({len(dirs)}): {', '.join(dirs[:10])}{'...' if len(dirs) > 10 else ''}")
-            if py_files:
-                parts.append(f"  Python文件({len(py_files)}): {', '.join(py_files[:8])}{'...' if len(py_files) > 8 else ''}")
-            if others and len(others) <= 15:
-                parts.append(f"  其他: {', '.join(others)}")
-            
-            llm_observation = "\n".join(parts)
-        elif tool_name == "files_exists":
-            exists = data.get("exists", False)
-            path = data.get("path", "")
-            llm_observation = f"文件 {path} {'存在' if exists else '不存在'}"
-        elif tool_name == "pyenv_parse_pyproject":
-            exists = data.get("exists", False)
-            if not exists:
-                llm_observation = f"pyproject.toml 不存在于 {data.get('path', '')}"
-            else:
-                deps = data.get("dependencies", [])
-                name = data.get("project_name", "")
-                llm_observation = f"项目 {name}，依赖 {len(deps)} 个包: {', '.join(deps[:10])}{'...' if len(deps) > 10 else ''}"
         else:
-            # Fallback: compact JSON
-            llm_observation = json.dumps(data, ensure_ascii=False)[:800]
+            llm_observation = _OBSERVATION_FORMATTERS.get(tool_name, _fmt_default)(data)
     
-    if transcript:
-        try:
-            # Store smart observation for LLM, not the raw tool output
-            transcript[-1]["observation"] = llm_observation
-        except Exception:
-            pass
-
-    # Align facts handling with unified observer: compute facts_delta and normalize
-    try:
-        from agent.observer import observe_v2
+    # Store smart observation for LLM, not the raw tool output (patched onto the last turn)
+    patch = {_PATCH_LAST: {"observation": llm_observation}}
+    update: DiscoverState = {"transcript": [patch], "ctx_window": [patch], "route": "react"}
+    if last and ok and state.get("pending_tool_key"):
+        update["tool_cache"] = {state["pending_tool_key"]: llm_observation}
+    window = state.get("ctx_window") or []
+    if window:
+        # The turn is now complete: format its prompt block once
+        update["turn_cache"] = [_format_turn({**window[-1], "observation": llm_observation})]
+
+    # Align facts handling with unified observer: emit facts_delta, the facts reducer merges and normalizes
+    if observe_v2 is not None:
         task_ctx = {"goal": state.get("goal", ""), "steps": [{"title": "discover"}]}
-        route_decision = observe_v2(task_ctx, 0, last, mode="discover", episode=1, facts=state.get("facts", {}))
-        facts = dict(state.get("facts", {}))
         try:
-            delta = route_decision.get("facts_delta") or {}
-            if isinstance(delta, dict):
-                facts.update(delta)
+            route_decision = observe_v2(task_ctx, 0, last, mode="discover", episode=1, facts=state.get("facts", {}))
         except Exception:
-            pass
-        # Normalize minimal expected keys
-        if "repo_path" in facts and not facts.get("repo_root"):
-            facts["repo_root"] = facts.pop("repo_path")
-        if facts.get("repo_root") and not facts.get("exec_root"):
-            facts["exec_root"] = facts["repo_root"]
-        facts.pop("work_dir", None)
-        state = {**state, "facts": facts}
-    except Exception:
-        # facts extraction is best-effort; ignore failures
-        pass
+            # facts extraction is best-effort; ignore failures
+            route_decision = None
+        delta = route_decision.get("facts_delta") if isinstance(route_decision, dict) else None
+        if isinstance(delta, dict):
+            update["facts"] = delta
 
-    return {**state, "transcript": transcript, "route": "react"}
+    return update
 
 
-@dispInfo("discover_react")
-def summarize_node(state: DiscoverState) -> DiscoverState:
-    """Ask the model to produce a natural-language understanding & setup plan."""
-    transcript = state.get("transcript", [])
+def _summary_prompt(state: DiscoverState) -> str:
+    window = state.get("ctx_window") or []
     goal = state.get("goal", "")
 
     # Build a compact transcript for the model
@@ -413,7 +553,7 @@ def summarize_node(state: DiscoverState) -> DiscoverState:
         f"目标: {goal}",
         "\n对话片段 (节选):",
     ]
-    for t in transcript[-12:]:
+    for t in window[-_CTX_WINDOW:]:
         th = str(t.get("thought", "")).strip()
         ac = str(t.get("action", "")).strip()
         ob = t.get("observation")
@@ -435,12 +575,29 @@ def summarize_node(state: DiscoverState) -> DiscoverState:
         )
     )
 
+    return "\n".join(lines)
+
+
+@dispInfo("discover_react")
+def summarize_node(state: DiscoverState) -> DiscoverState:
+    """Ask the model to produce a natural-language understanding & setup plan."""
     try:
-        summary = llm_completion("\n".join(lines), temperature=0.2, max_tokens=700).strip()
+        summary = llm_completion(_summary_prompt(state), tier="strong", temperature=0.2, max_tokens=700).strip()
     except Exception:
         summary = "(总结失败)"
 
-    return {**state, "summary": summary, "finished": True}
+    return {"summary": summary, "finished": True}
+
+
+@dispInfo("discover_react")
+async def summarize_node_async(state: DiscoverState) -> DiscoverState:
+    """Async variant of summarize_node used by ainvoke."""
+    try:
+        summary = (await llm_acompletion(_summary_prompt(state), tier="strong", temperature=0.2, max_tokens=700)).strip()
+    except Exception:
+        summary = "(总结失败)"
+
+    return {"summary": summary, "finished": True}
 
 
 def _react_route(state: DiscoverState):
@@ -452,12 +609,38 @@ def _react_route(state: DiscoverState):
     return "react"
 
 
-def create_discover_graph():
-    """Build a standalone discover graph: react → execute(ToolNode) → observe → react ... → summarize → END"""
+_CHECKPOINT_DB = os.path.join(".setupagent", "discover_ckpt.db")
+
+
+@lru_cache(maxsize=1)
+def _sqlite_checkpointer():
+    """Lazily open the sqlite checkpointer; None when langgraph-checkpoint-sqlite is not installed."""
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+    except ImportError:
+        # Cached: reported once per process rather than on every run
+        debug.log("[discover] thread_id given but langgraph-checkpoint-sqlite is not installed; running without checkpoints")
+        return None
+    try:
+        os.makedirs(os.path.dirname(_CHECKPOINT_DB), exist_ok=True)
+        conn = sqlite3.connect(_CHECKPOINT_DB, check_same_thread=False)
+        return SqliteSaver(conn)
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=2)
+def create_discover_graph(checkpointer=None):
+    """Build a standalone discover graph: react → execute(ToolNode) → observe → react ... → summarize → END
+
+    With a checkpointer, state is persisted after every node and a run can be resumed by thread_id.
+    The compiled graph holds no per-run state, so it is built once per checkpointer and shared by
+    every run (including concurrent batch runs).
+    """
     g = StateGraph(DiscoverState)
 
-    # LLM thought/action node
-    g.add_node("react", react_node)
+    # LLM thought/action node（同时提供同步/异步实现：invoke 与 ainvoke 都可用）
+    g.add_node("react", RunnableLambda(react_node, afunc=react_node_async, name="react"))
 
     # Tool execution node (read-only tools only)
     g.add_node(
@@ -485,7 +668,7 @@ def create_discover_graph():
     g.add_node("observe", observe_node)
 
     # Final summarization node
-    g.add_node("summarize", summarize_node)
+    g.add_node("summarize", RunnableLambda(summarize_node, afunc=summarize_node_async, name="summarize"))
 
     # Entry and edges
     g.set_entry_point("react")
@@ -494,16 +677,11 @@ def create_discover_graph():
     g.add_edge("observe", "react")
     g.add_edge("summarize", END)
 
-    return g.compile()
-
+    return g.compile(checkpointer=checkpointer)
 
-def run_discover_react(goal: str, seed_facts: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    """Run the standalone discover agent to build understanding and produce a summary.
 
-    Returns a dict with keys: transcript, summary, facts (best-effort), raw_state
-    """
-    app = create_discover_graph()
-    init: DiscoverState = {
+def _initial_state(goal: str, seed_facts: Optional[Dict[str, Any]]) -> DiscoverState:
+    return {
         "goal": goal,
         "messages": [],
         "transcript": [],
@@ -511,17 +689,23 @@ def run_discover_react(goal: str, seed_facts: Optional[Dict[str, Any]] = None) -
         "finished": False,
         "facts": dict(seed_facts or {}),
         "route": "react",
+        "ctx_window": [],
+        "turn_cache": [],
+        "tool_cache": {},
+        "pending_tool_key": "",
     }
+
+
+def _failed_state(init: DiscoverState, e: Exception) -> DiscoverState:
     try:
-        out = app.invoke(init, {"recursion_limit": 100})
-    except Exception as e:
-        try:
-            debug.note("discover_react_error", str(e))
-        except Exception:
-            pass
-        out = init
-        out["summary"] = f"(运行失败) {type(e).__name__}: {e}"
+        debug.note("discover_react_error", str(e))
+    except Exception:
+        pass
+    init["summary"] = f"(运行失败) {type(e).__name__}: {e}"
+    return init
 
+
+def _discover_result(out: Dict[str, Any]) -> Dict[str, Any]:
     return {
         "transcript": out.get("transcript", []),
         "summary": out.get("summary", ""),
@@ -530,3 +714,63 @@ def run_discover_react(goal: str, seed_facts: Optional[Dict[str, Any]] = None) -
     }
 
 
+def run_discover_react(
+    goal: str, seed_facts: Optional[Dict[str, Any]] = None, thread_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Run the standalone discover agent to build understanding and produce a summary.
+
+    When thread_id is given and sqlite checkpointing is available, every node's state is saved;
+    calling again with the same thread_id after a failure resumes from the last checkpoint
+    instead of replaying earlier tool calls and LLM turns.
+
+    Returns a dict with keys: transcript, summary, facts (best-effort), raw_state
+    """
+    checkpointer = _sqlite_checkpointer() if thread_id else None
+    app = create_discover_graph(checkpointer)
+    init = _initial_state(goal, seed_facts)
+    config: Dict[str, Any] = {"recursion_limit": 100}
+    if checkpointer is not None:
+        config["configurable"] = {"thread_id": thread_id}
+    try:
+        resume = False
+        if checkpointer is not None:
+            snapshot = app.get_state(config)
+            # An unfinished checkpoint on this thread (pending next nodes) resumes with input None.
+            # A finished one is cleared first: the append reducers would otherwise carry the old
+            # run's transcript, context window and tool cache into the new run.
+            resume = bool(snapshot.next)
+            if not resume and snapshot.values:
+                checkpointer.delete_thread(thread_id)
+        out = app.invoke(None if resume else init, config)
+    except Exception as e:
+        out = _failed_state(init, e)
+
+    return _discover_result(out)
+
+
+async def run_discover_react_async(goal: str, seed_facts: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Async counterpart of run_discover_react (graph driven via ainvoke, LLM calls awaited)."""
+    app = create_discover_graph()
+    init = _initial_state(goal, seed_facts)
+    try:
+        out = await app.ainvoke(init, {"recursion_limit": 100})
+    except Exception as e:
+        out = _failed_state(init, e)
+
+    return _discover_result(out)
+
+
+def run_discover_react_batch(
+    goals: List[str], seed_facts: Optional[List[Optional[Dict[str, Any]]]] = None
+) -> List[Dict[str, Any]]:
+    """Run several independent discover goals concurrently; results keep the order of goals.
+
+    seed_facts, if given, is aligned with goals (one seed dict or None per goal).
+    """
+    seeds = list(seed_facts or [])
+    seeds += [None] * (len(goals) - len(seeds))
+
+    async def _gather() -> List[Dict[str, Any]]:
+        return list(await asyncio.gather(*(run_discover_react_async(g, f) for g, f in zip(goals, seeds))))
+
+    return run_coro_sync(_gather())
@@ -32,22 +32,28 @@ def make_generic_tool_call_message(tool_name: str, tool_args: Dict[str, Any] | N
     )
 
 
+# ToolNode 追加的 ToolMessage 总在消息列表末尾附近，只回看最近这么多条
+_TOOL_RESULT_SCAN = 16
+
+
 def extract_last_tool_result(messages: List[Any]) -> Dict[str, Any]:
     """
     从消息列表中提取最近一次工具执行结果。
     期望由 ToolNode 追加的 ToolMessage，内容为JSON字符串。
     """
-    for msg in reversed(messages or []):
-        if isinstance(msg, ToolMessage):
+    if not messages:
+        return {}
+    n = len(messages)
+    for i in range(n - 1, max(n - _TOOL_RESULT_SCAN, 0) - 1, -1):
+        msg = messages[i]
+        # type() 比较是快路径；ToolMessage 子类再退回 isinstance
+        if type(msg) is ToolMessage or isinstance(msg, ToolMessage):
             try:
                 return json.loads(msg.content)
-            except Exception:
+            except (json.JSONDecodeError, TypeError):
                 # 若内容不是合法JSON，则视为工具错误，包装为失败结果以触发重规划
-                text = ""
-                try:
-                    text = str(msg.content)
-                except Exception:
-                    text = ""
+                content = msg.content
+                text = content if isinstance(content, str) else (str(content) if content else "")
                 return {
                     "exit_code": 1,
                     "stdout": "",
@@ -58,18 +64,20 @@ def extract_last_tool_result(messages: List[Any]) -> Dict[str, Any]:
     return {}
 
 
-def _build_windows_prompt(nl_instruction: str, work_dir: str) -> str:
-    work_str = str(work_dir).replace('\\', '\\\\')
-    return f"""
+# 命令翻译提示词：只有工作目录与用户请求两处变化，模块加载时定义一次
+_WIN_PROMPT_TMPL = """
 You are a helpful assistant that translates natural language into a single, self-contained shell command.
 Rules:
 - Output ONLY the command, no explanation, no quotes.
-- Assume cwd is {work_str}
+- Assume cwd is %s
 - IMPORTANT: Windows system. Use PowerShell commands, avoid Unix tools.
 - Use single backslashes in Windows paths; quote only when path contains spaces.
 - Prefer simple, non-interactive commands.
 
-User request: {nl_instruction}
+User request: %s
 """
 
 
+def _build_windows_prompt(nl_instruction: str, work_dir: str) -> str:
+    work_str = str(work_dir).replace('\\', '\\\\')
+    return _WIN_PROMPT_TMPL % (work_str, nl_instruction)
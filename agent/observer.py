@@ -1,104 +1,374 @@
-from typing import Tuple, Dict, Any, Optional
-from agent.task_types import Task, StepResult
-from utils import llm_completion
-from agent.debug import dispInfo, debug
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import deque
+from typing import Tuple, Dict, Any, List, Optional
+from agent.task_types import Task, StepResult, plan_titles
+from tools.base import parse_tool_dict
+from utils import cached_llm_completion_streamed, cached_llm_acompletion_streamed, extract_json_object, json_object_done, json_dumps_bounded, json_loads, llm_cache_stats, llm_embed
+from agent.debug import debug
 
 
-def _short(text: Optional[str], n: int = 600) -> str:
-    return (text or "")[:n]
+# README 信息提取用到的正则，模块加载时编译一次
+# extract_readme_info 逐行匹配（match 锚定行首）
+_RE_TITLE = re.compile(r"\s*#\s+(.+)$")
+_RE_HEADING = re.compile(r"\s*#\s+")
+# 安装/运行命令合成一条正则，按命中的分组名（install/run）归类
+_RE_COMMAND = re.compile(
+    r"(?i)(?:\s*[-*]\s*)?"
+    r"(?:(?P<install>pip(?:x)?|conda|poetry|pdm)\s+.+"
+    r"|(?P<run>python\s+-m\s+\S+|pytest\b.*|uvicorn\b.*|streamlit\b.*|gunicorn\b.*|make\s+\S+)\s*)$"
+)
+_RE_PYVER = re.compile(r"(?i)python\s*(?:>=|=>|>=\s*)?\s*([0-9]+\.[0-9]+)")
+# 入口点只从命令语境中取：Usage:/命令: 行、行内代码 `cmd ...`、代码块内的行首词（可带 $/> 提示符）
+_RE_USAGE = re.compile(r"(?i)(?:\s*[-*]\s*)?(?:Usage:|命令:)\s*(\w[\w-]+)")
+_RE_CODE_SPAN = re.compile(r"(?<!`)`\s*(\w[\w-]+)[^`]*`(?!`)")
+_RE_CODE_LINE = re.compile(r"\s*(?:[$>]\s+)?(\w[\w-]+)")
+_RE_LINK = re.compile(r"\((https?://[^)]+)\)")
+
+
+# 规则 D 中可直接从工具返回写入 facts 的仓库定位字段
+_FACT_PATH_FIELDS = ("repo_root", "project_root", "project_name")
+
+# 观察者关键数据摘要展示的字段（遍历较小的字段表，每个字段一次字典查找）
+_OBSERVE_KEY_FIELDS = (
+    "path", "exists", "content", "exit_code", "command", "installer", "reason",
+    # git/files 关键字段补充
+    "existed", "cloned", "project_root", "project_name", "repo_root",
+    "remote_url", "branch", "is_repo", "dir", "entries", "truncated",
+)
+
+
+# 观察者调用走共享的 prompt 哈希缓存（utils.lru_cached_llm）；OBSERVER_CACHE=0 时每次都请求 LLM
+_OBSERVER_CACHE = os.environ.get("OBSERVER_CACHE", "1") != "0"
+# OBSERVER_CACHE_LOG=1 时每次观察后把命中统计写入调试日志
+_OBSERVER_CACHE_LOG = os.environ.get("OBSERVER_CACHE_LOG", "0") == "1"
+
+# 语义缓存（可选）：OBSERVER_SEMANTIC_MODEL 指定 embedding 模型时启用。精确缓存未命中、
+# 但规范化后的提示词与历史提示词余弦相似度 ≥ 阈值时，直接复用当时的路由响应。
+_SEMANTIC_MODEL = os.environ.get("OBSERVER_SEMANTIC_MODEL", "") if _OBSERVER_CACHE else ""
+_SEMANTIC_THRESHOLD = 0.92
+_SEMANTIC_EXCERPT = 200
+# 条目为 (任务目标哈希, (步骤索引, 工具名), 向量, 响应)：只在同一目标、同一步骤、同一工具的成功结果之间比较相似度，
+# 步骤序号或成败不同的提示词文本上仍很相似，不能互相复用路由；目标哈希放在首位便于按目标清除
+_semantic_entries: "deque[Tuple[str, Tuple[int, str], List[float], str]]" = deque(maxlen=256)
+
+_RE_OUTPUT_LEN = re.compile(r"^  输出长度: .*\n?", re.MULTILINE)
+_RE_EXCERPT_FIELD = re.compile(r"^  (std(?:out|err)_(?:head|tail)): ", re.MULTILINE)
+_EXCERPT_MARK = "最近一次输出摘录：\n"
+
+
+def _canonical_prompt(prompt: str) -> str:
+    """去掉易变部分（输出字节数、摘录中前 200 字符以外的内容），用于语义比较。"""
+    head, sep, excerpts = prompt.partition(_EXCERPT_MARK)
+    head = _RE_OUTPUT_LEN.sub("", head)
+    if not sep:
+        return head
+    parts = _RE_EXCERPT_FIELD.split(excerpts)
+    fields = "".join(f"{name}: {body[:_SEMANTIC_EXCERPT]}\n" for name, body in zip(parts[1::2], parts[2::2]))
+    return head + sep + fields
+
+
+def _goal_key(goal: Any) -> str:
+    return hashlib.sha256(str(goal or "").encode("utf-8")).hexdigest()
+
+
+def _semantic_scope(current_index: int, last_result: Optional[StepResult]) -> Optional[Tuple[int, str]]:
+    """语义缓存的作用域 (步骤索引, 工具名)；上一步失败（ok 非 True、有错误或退出码非 0）时返回 None，不走语义缓存。"""
+    parsed = parse_tool_dict(last_result if isinstance(last_result, dict) else {})
+    if parsed["ok"] is not True or parsed["error"]:
+        return None
+    data = parsed["data"] if isinstance(parsed["data"], dict) else {}
+    if data.get("exit_code") not in (None, 0):
+        return None
+    return current_index, str(parsed["tool"])
+
+
+def _semantic_lookup(prompt: str, goal_key: str, scope: Tuple[int, str]) -> Tuple[Optional[List[float]], Optional[str]]:
+    """返回 (规范化提示词的向量, 命中的历史响应)；embedding 调用失败时两者均为 None。"""
+    try:
+        vec = llm_embed(_canonical_prompt(prompt), _SEMANTIC_MODEL)
+    except Exception:
+        return None, None
+    best, best_text = _SEMANTIC_THRESHOLD, None
+    for key, entry_scope, cached_vec, text in list(_semantic_entries):
+        if key != goal_key or entry_scope != scope:
+            continue
+        sim = sum(a * b for a, b in zip(vec, cached_vec))
+        if sim >= best:
+            best, best_text = sim, text
+    if best_text is not None:
+        debug.note("observer_semantic_hit", round(best, 4))
+    return vec, best_text
+
+
+def _semantic_store(goal_key: str, scope: Optional[Tuple[int, str]], vec: Optional[List[float]], resp: str) -> None:
+    if scope is not None and vec is not None and resp and resp != "{}":
+        _semantic_entries.append((goal_key, scope, vec, resp))
+
+
+# 观察者各决策路径的计数：规则直出 / 语义命中 / 语义未命中 / 实际发起的 LLM 调用（其中精确命中见 llm_cache）
+_stats = {"rule": 0, "semantic_hits": 0, "semantic_misses": 0, "llm_calls": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(*names: str) -> None:
+    with _stats_lock:
+        for name in names:
+            _stats[name] += 1
+    if _OBSERVER_CACHE_LOG:
+        debug.note("observer_cache", observer_cache_stats())
+
+
+def observer_cache_stats() -> Dict[str, Any]:
+    """返回观察者各路径的计数，附带共享 LLM 缓存（精确匹配，决策/观察共用）的统计与语义缓存条目数。"""
+    with _stats_lock:
+        stats: Dict[str, Any] = dict(_stats)
+    stats["semantic_size"] = len(_semantic_entries)
+    stats["llm_cache"] = llm_cache_stats()
+    return stats
+
+
+def observer_cache_clear(goal: Optional[str] = None) -> None:
+    """清空语义缓存；传入 goal 时只清除该任务目标下的条目。精确缓存由决策/观察共用，不在此清理。"""
+    if goal is None:
+        _semantic_entries.clear()
+        return
+    key = _goal_key(goal)
+    kept = [e for e in list(_semantic_entries) if e[0] != key]
+    _semantic_entries.clear()
+    _semantic_entries.extend(kept)
+
+
+# 输出摘录：不超过两段时整段放进 head；更长时取不重叠的首尾两段，中间用省略标记
+_SLICE = 600
+
+
+def _head_tail(text: str) -> Tuple[str, str]:
+    n = len(text)
+    if n <= 2 * _SLICE:
+        return text, ""
+    return text[:_SLICE], f"… <省略 {n - 2 * _SLICE} 字节> …" + text[-_SLICE:]
+
+
+# 提示词中 facts 的截断 JSON 单条缓存：(facts 本身, 当时长度, JSON 文本)。
+# 持有引用避免 id 复用误命中；工作流每次观察都会生成新的 facts 字典，更新后自动失效。
+_FACTS_LIMIT = 1200
+_facts_json_cache: Optional[Tuple[dict, int, str]] = None
+
+
+def _facts_json(facts: Optional[Dict[str, Any]]) -> str:
+    global _facts_json_cache
+    facts = facts or {}
+    cached = _facts_json_cache
+    if cached is not None and cached[0] is facts and cached[1] == len(facts):
+        return cached[2]
+    text = json_dumps_bounded(facts, _FACTS_LIMIT)
+    _facts_json_cache = (facts, len(facts), text)
+    return text
+
+
+def _output_excerpt(value: Any) -> Tuple[int, str, str]:
+    """返回 (长度, 头部, 尾部)。bytes 类输出只解码首尾切片，不对整段做 str()/解码。"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        buf = memoryview(value)
+        n = buf.nbytes
+        if n <= 2 * _SLICE:
+            return n, bytes(buf).decode("utf-8", errors="replace"), ""
+        head = bytes(buf[:_SLICE]).decode("utf-8", errors="replace")
+        tail = bytes(buf[-_SLICE:]).decode("utf-8", errors="replace")
+        return n, head, f"… <省略 {n - 2 * _SLICE} 字节> …" + tail
+    text = value if isinstance(value, str) else str(value)
+    return (len(text), *_head_tail(text))
+
+
+# 观察者提示词的静态部分（职责/规范/输出格式），作为 system 前缀发送；结果与事实放在 user 消息
+_OBSERVE_SYSTEM_PROMPT = (
+    "你是观察者。基于结果与事实，决定下一跳路由与可能的事实增量。\n\n"
+    "【路由职责】\n"
+    "- 你的主要职责是评估当前步骤的执行结果，决定步骤级路由\n"
+    "- 路由集合: decide | repeat_step | skip_step | end\n\n"
+    "【facts_delta 规范】\n"
+    "- 统一命名：仅使用 repo_root, project_root, project_name, exec_root 等标准键\n"
+    "- 不要输出 clone_path/repo_path/work_dir 等旧键\n"
+    "- 路径叙述一律以 repo_root/project_root 为参照\n\n"
+    "【输出格式】\n"
+    "仅输出 JSON：{\n"
+    "  \"route\": \"decide|repeat_step|skip_step|end\",\n"
+    "  \"facts_delta\": { } | null,\n"
+    "  \"success\": true | false | null,\n"
+    "  \"notes\": \"一句话原因\"\n"
+    "}"
+)
+
+# 观察者提示词的动态部分（user 消息），每次调用只做一次 format_map 填充
+_OBSERVE_PROMPT_TMPL = (
+    "目标: {goal}\n"
+    "计划步骤标题序列: {titles}\n"
+    "当前索引: {idx}\n"
+    "最近一次结果（统一格式）：\n"
+    "  工具: {tool}\n"
+    "  状态: {status}\n"
+    "  关键数据: {key_data}\n"
+    "  错误: {error}\n"
+    "  输出长度: stdout={out_len}字节, stderr={err_len}字节\n"
+    "已知事实: {facts}\n"
+    "最近一次输出摘录：\n"
+    "  stdout_head: {out_head}\n"
+    "  stdout_tail: {out_tail}\n"
+    "  stderr_head: {err_head}\n"
+    "  stderr_tail: {err_tail}"
+)
+
+
+def _try_rule_based_route(task: Task, current_index: int, last_result: Optional[StepResult], mode: str, facts: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """确定性路由：事实已能直接决定下一跳时返回决策，否则返回 None 交给 LLM。"""
+    facts = facts if isinstance(facts, dict) else {}
+    # 规则 A/B：discover 阶段已定位项目根且识别到安装入口 → 切换到 execute
+    if mode == "discover" and facts.get("project_root") and (
+        facts.get("has_setup_py") or facts.get("has_pyproject") or facts.get("has_requirements_txt")
+    ):
+        return {"route": "decide", "mode": "execute", "facts_delta": None, "success": True, "notes": "rule:A/B"}
+    steps_len = len(task.get("steps", []))
+    # 规则 C：最后一次执行成功且已越过全部步骤 → 结束（工具返回的 exit_code 在 data 内）
+    if isinstance(last_result, dict) and current_index >= steps_len:
+        parsed = parse_tool_dict(last_result)
+        data = parsed["data"] if isinstance(parsed["data"], dict) else {}
+        if parsed["ok"] is True and data.get("exit_code") == 0:
+            return {"route": "end", "facts_delta": None, "success": True, "notes": "rule:end"}
+    # 规则 D：execute 阶段工具成功且无错误、后面还有步骤 → 直接推进；工具带回的仓库定位字段确定性地写入 facts
+    if mode == "execute" and isinstance(last_result, dict) and current_index + 1 < steps_len:
+        parsed = parse_tool_dict(last_result)
+        if parsed["ok"] is True and not parsed["error"]:
+            data = parsed["data"] if isinstance(parsed["data"], dict) else {}
+            delta = {
+                k: data[k] for k in _FACT_PATH_FIELDS
+                if isinstance(data.get(k), str) and data[k] and data[k] != facts.get(k)
+            }
+            return {"route": "decide", "facts_delta": delta or None, "success": True, "notes": "rule:tool_ok"}
+    return None
 
 
 def observe_v2(task: Task, current_index: int, last_result: Optional[StepResult], *, mode: str, episode: int, facts: Dict[str, Any]) -> Dict[str, Any]:
-    """LLM 驱动的观察与路由，返回结构化决策。"""
-    steps = task.get("steps", [])
-    titles = [s.get("title", f"步骤{i+1}") for i, s in enumerate(steps)]
-    import json as _json
-    import os as _os
-    
-    # 使用统一工具接口解析结果
-    from tools.base import parse_tool_response
-    
+    """LLM 驱动的观察与路由，返回结构化决策；事实已能确定路由时跳过 LLM 调用。"""
+    ruled = _try_rule_based_route(task, current_index, last_result, mode, facts)
+    if ruled is not None:
+        debug.note("observer_rule_route", ruled["notes"])
+        _count("rule")
+        return ruled
+
+    prompt = _observe_prompt(task, current_index, last_result, facts)
+    scope = _semantic_scope(current_index, last_result) if _SEMANTIC_MODEL else None
+    goal_key = _goal_key(task.get("goal")) if scope is not None else ""
+    vec = None
+    if scope is not None:
+        vec, hit = _semantic_lookup(prompt, goal_key, scope)
+        if hit is not None:
+            _count("semantic_hits")
+            return _route_from_response(hit, facts)
     try:
-        _lr = dict(last_result or {})
+        # 路由结果是单个 JSON 对象：流式接收，对象闭合即停止
+        resp = cached_llm_completion_streamed(
+            prompt, stop=json_object_done, stop_on="}", system=_OBSERVE_SYSTEM_PROMPT,
+            cacheable=_OBSERVER_CACHE, temperature=0.2, max_tokens=400
+        ).strip()
     except Exception:
-        _lr = {}
-    
-    # 解析工具返回
-    parsed = parse_tool_response(_json.dumps(_lr))
+        resp = "{}"
+    _semantic_store(goal_key, scope, vec, resp)
+    if vec is not None:
+        _count("semantic_misses", "llm_calls")
+    else:
+        _count("llm_calls")
+    return _route_from_response(resp, facts)
+
+
+async def observe_v2_async(task: Task, current_index: int, last_result: Optional[StepResult], *, mode: str, episode: int, facts: Dict[str, Any]) -> Dict[str, Any]:
+    """observe_v2 的异步版本（规则路由、提示词与解析完全一致，仅 LLM 调用改为 await）。"""
+    ruled = _try_rule_based_route(task, current_index, last_result, mode, facts)
+    if ruled is not None:
+        debug.note("observer_rule_route", ruled["notes"])
+        _count("rule")
+        return ruled
+
+    prompt = _observe_prompt(task, current_index, last_result, facts)
+    scope = _semantic_scope(current_index, last_result) if _SEMANTIC_MODEL else None
+    goal_key = _goal_key(task.get("goal")) if scope is not None else ""
+    vec = None
+    if scope is not None:
+        vec, hit = await asyncio.to_thread(_semantic_lookup, prompt, goal_key, scope)
+        if hit is not None:
+            _count("semantic_hits")
+            return _route_from_response(hit, facts)
+    try:
+        resp = (
+            await cached_llm_acompletion_streamed(
+                prompt, stop=json_object_done, stop_on="}", system=_OBSERVE_SYSTEM_PROMPT,
+                cacheable=_OBSERVER_CACHE, temperature=0.2, max_tokens=400
+            )
+        ).strip()
+    except Exception:
+        resp = "{}"
+    _semantic_store(goal_key, scope, vec, resp)
+    if vec is not None:
+        _count("semantic_misses", "llm_calls")
+    else:
+        _count("llm_calls")
+    return _route_from_response(resp, facts)
+
+
+def _observe_prompt(task: Task, current_index: int, last_result: Optional[StepResult], facts: Dict[str, Any]) -> str:
+    titles = plan_titles(task)
+
+    # 解析工具返回（直接读取已有的 dict，不复制、不经 JSON 往返）
+    parsed = parse_tool_dict(last_result if isinstance(last_result, dict) else {})
     tool_name = parsed.get("tool", "unknown")
     tool_ok = parsed.get("ok", False)
     tool_data = parsed.get("data", {})
     tool_error = parsed.get("error")
     
     # 构造关键数据摘要（仅显示重要字段）
-    key_fields = [
-        "path", "exists", "content", "exit_code", "command", "installer", "reason",
-        # git/files 关键字段补充
-        "existed", "cloned", "project_root", "project_name", "repo_root",
-        "remote_url", "branch", "is_repo", "dir", "entries", "truncated"
-    ]
-    data_summary = {k: v for k, v in tool_data.items() if k in key_fields}
-    data_summary_str = _json.dumps(data_summary, ensure_ascii=False)[:300]
+    data_summary = {k: tool_data[k] for k in _OBSERVE_KEY_FIELDS if k in tool_data}
+    data_summary_str = json_dumps_bounded(data_summary, 300)
     
-    # 提取 stdout/stderr（如果是 run_instruction）
-    _stdout_full = str(tool_data.get("stdout", ""))
-    _stderr_full = str(tool_data.get("stderr", ""))
-    _stdout_len = len(_stdout_full)
-    _stderr_len = len(_stderr_full)
-    _slice = 600
-    _stdout_head = _stdout_full[:_slice]
-    _stdout_tail = _stdout_full[-_slice:] if _stdout_len > _slice else ""
-    _stderr_head = _stderr_full[:_slice]
-    _stderr_tail = _stderr_full[-_slice:] if _stderr_len > _slice else ""
-
-    prompt = (
-        "你是观察者。基于结果与事实，决定下一跳路由与可能的事实增量。\n"
-        f"目标: {task.get('goal','')}\n"
-        f"计划步骤标题序列: {titles}\n"
-        f"当前索引: {current_index}\n"
-        f"最近一次结果（统一格式）：\n"
-        f"  工具: {tool_name}\n"
-        f"  状态: {'成功' if tool_ok else '失败'}\n"
-        f"  关键数据: {data_summary_str}\n"
-        f"  错误: {tool_error or '无'}\n"
-        f"  输出长度: stdout={_stdout_len}字节, stderr={_stderr_len}字节\n"
-        f"  stdout_head: {_short(_stdout_head)}\n"
-        f"  stdout_tail: {_short(_stdout_tail)}\n"
-        f"  stderr_head: {_short(_stderr_head)}\n"
-        f"  stderr_tail: {_short(_stderr_tail)}\n"
-        f"已知事实: {_json.dumps(facts or {}, ensure_ascii=False)[:1200]}\n\n"
-        "【路由职责】\n"
-        "- 你的主要职责是评估当前步骤的执行结果，决定步骤级路由\n"
-        "- 路由集合: decide | repeat_step | skip_step | end\n\n"
-        "【facts_delta 规范】\n"
-        "- 统一命名：仅使用 repo_root, project_root, project_name, exec_root 等标准键\n"
-        "- 不要输出 clone_path/repo_path/work_dir 等旧键\n"
-        "- 路径叙述一律以 repo_root/project_root 为参照\n\n"
-        "【输出格式】\n"
-        "仅输出 JSON：{\n"
-        "  \"route\": \"decide|repeat_step|skip_step|end\",\n"
-        "  \"facts_delta\": { } | null,\n"
-        "  \"success\": true | false | null,\n"
-        "  \"notes\": \"一句话原因\"\n"
-        "}"
-    )
+    # 提取 stdout/stderr（如果是 run_instruction），放在 user 消息末尾
+    _stdout_len, _stdout_head, _stdout_tail = _output_excerpt(tool_data.get("stdout", ""))
+    _stderr_len, _stderr_head, _stderr_tail = _output_excerpt(tool_data.get("stderr", ""))
+
+    prompt = _OBSERVE_PROMPT_TMPL.format_map({
+        "goal": task.get("goal", ""),
+        "titles": titles,
+        "idx": current_index,
+        "tool": tool_name,
+        "status": "成功" if tool_ok else "失败",
+        "key_data": data_summary_str,
+        "error": tool_error or "无",
+        "out_len": _stdout_len,
+        "err_len": _stderr_len,
+        "out_head": _stdout_head,
+        "out_tail": _stdout_tail,
+        "err_head": _stderr_head,
+        "err_tail": _stderr_tail,
+        "facts": _facts_json(facts),
+    })
     # debug.note("observer_prompt", prompt)  # 提示词太长，不记录
-    try:
-        resp = llm_completion(prompt, temperature=0.2, max_tokens=400).strip()
-    except Exception:
-        resp = "{}"
+    return prompt
+
+
+def _route_from_response(resp: str, facts: Dict[str, Any]) -> Dict[str, Any]:
     debug.note("observer_raw_resp", resp)
 
-    import json, re
     data: Optional[Dict[str, Any]] = None
     try:
-        data = json.loads(resp)
-    except Exception:
-        m = re.search(r"\{.*\}", resp, re.DOTALL)
-        if m:
+        data = json_loads(resp)
+    except json.JSONDecodeError:
+        blob = extract_json_object(resp)
+        if blob:
             try:
-                data = json.loads(m.group(0))
-            except Exception:
+                data = json_loads(blob)
+            except json.JSONDecodeError:
                 data = None
     if not isinstance(data, dict):
         data = {"route": "decide", "notes": "默认继续"}
@@ -116,7 +386,7 @@ def observe_v2(task: Task, current_index: int, last_result: Optional[StepResult]
             # 填充 project_name
             pr = fd.get("project_root")
             if isinstance(pr, str) and pr and not fd.get("project_name"):
-                fd["project_name"] = _os.path.basename(pr.rstrip("\\/")) or fd.get("project_name")
+                fd["project_name"] = os.path.basename(pr.rstrip("\\/")) or fd.get("project_name")
             # 补齐 exec_root = repo_root
             if not fd.get("exec_root"):
                 if fd.get("repo_root"):
@@ -126,7 +396,7 @@ def observe_v2(task: Task, current_index: int, last_result: Optional[StepResult]
             # 若仅有 repo_root 与 project_name，尝试推导 project_root（纯字符串拼接）
             if not fd.get("project_root") and fd.get("repo_root") and fd.get("project_name"):
                 try:
-                    fd["project_root"] = _os.path.join(fd["repo_root"], fd["project_name"])  # 不访问文件系统
+                    fd["project_root"] = os.path.join(fd["repo_root"], fd["project_name"])  # 不访问文件系统
                 except Exception:
                     pass
             # 清理旧键
@@ -157,59 +427,88 @@ def extract_readme_info(readme_text: str) -> Dict[str, Any]:
     if not text:
         return info
 
-    import re
-    # 粗略提取项目名（首行标题）
-    m = re.search(r"^\s*#\s+(.+)$", text, re.MULTILINE)
-    if m:
-        info["project_name"] = m.group(1).strip()
-
-    # 简短描述：标题下的第一段非空文本
-    try:
-        lines = text.splitlines()
-        desc = []
-        hit_title = False
-        for line in lines:
-            if not hit_title and re.match(r"^\s*#\s+", line):
-                hit_title = True
-                continue
-            if hit_title:
-                if line.strip() == "":
-                    if desc:
-                        break
-                    else:
-                        continue
+    # 单趟逐行扫描：标题、描述、命令、Python 版本、入口与链接一次收集完
+    project_name = pyver = None
+    desc = []
+    hit_title = False
+    desc_done = False
+    in_fence = False
+    install_cmds, run_cmds, entry_cmds, links = [], [], [], []
+    for line in text.splitlines():
+        # 粗略提取项目名（首个标题）；简短描述：标题下的第一段非空文本
+        if project_name is None and "#" in line:
+            m = _RE_TITLE.match(line)
+            if m:
+                project_name = m.group(1).strip()
+        if not desc_done:
+            if not hit_title:
+                hit_title = _RE_HEADING.match(line) is not None
+            elif line.strip() == "":
+                desc_done = bool(desc)
+            else:
                 desc.append(line.strip())
-        if desc:
-            info["description"] = " ".join(desc)[:400]
-    except Exception:
-        pass
 
-    # 命令提取
-    install_cmds = re.findall(r"(?mi)^(?:\s*[-*]\s*)?(pip(?:x)?|conda|poetry|pdm)\s+[^\n]+$", text)
-    run_cmds = re.findall(r"(?mi)^(?:\s*[-*]\s*)?(python\s+-m\s+\S+|pytest\b[^\n]*|uvicorn\b[^\n]*|streamlit\b[^\n]*|gunicorn\b[^\n]*|make\s+\S+)\s*$", text)
-    if install_cmds:
-        info["install_cmds"] = list({cmd.strip() for cmd in install_cmds})
-    if run_cmds:
-        info["run_cmds"] = list({cmd.strip() for cmd in run_cmds})
+        # 命令提取
+        m = _RE_COMMAND.match(line)
+        if m:
+            kind = m.lastgroup
+            (install_cmds if kind == "install" else run_cmds).append(m.group(kind).strip())
 
-    # Python 版本/依赖的线索
-    pyver = re.search(r"(?i)python\s*(?:>=|=>|>=\s*)?\s*([0-9]+\.[0-9]+)", text)
-    if pyver:
-        info["python_min_version"] = pyver.group(1)
+        # 入口点线索
+        if ("```" in line or "~~~" in line) and line.lstrip().startswith(("```", "~~~")):
+            in_fence = not in_fence
+        elif in_fence:
+            m = _RE_CODE_LINE.match(line)
+            if m:
+                entry_cmds.append(m.group(1))
+        else:
+            if ":" in line:
+                m = _RE_USAGE.match(line)
+                if m:
+                    entry_cmds.append(m.group(1))
+            if "`" in line:
+                entry_cmds.extend(_RE_CODE_SPAN.findall(line))
 
-    # 入口点线索
-    entry_cmds = re.findall(r"(?mi)^(?:\s*[-*]\s*)?(?:Usage:|命令:)?\s*(\w[\w-]+)\b[^\n]*$", text)
-    if entry_cmds:
-        info["entry_points"] = list({c.strip() for c in entry_cmds})
+        # Python 版本/依赖的线索（取首次出现）
+        if pyver is None and "python" in line.lower():
+            m = _RE_PYVER.search(line)
+            if m:
+                pyver = m.group(1)
 
-    # 链接提取
-    links = re.findall(r"\((https?://[^)]+)\)", text)
+        # 链接提取
+        if "http" in line:
+            links.extend(_RE_LINK.findall(line))
+
+    if project_name is not None:
+        info["project_name"] = project_name
+    if desc:
+        info["description"] = " ".join(desc)[:400]
+    # 去重并保持 README 中的出现顺序（安装命令的先后即优先级）
+    if install_cmds:
+        info["install_cmds"] = list(dict.fromkeys(install_cmds))
+    if run_cmds:
+        info["run_cmds"] = list(dict.fromkeys(run_cmds))
+    if pyver is not None:
+        info["python_min_version"] = pyver
+    if entry_cmds:
+        info["entry_points"] = list(dict.fromkeys(entry_cmds))
     if links:
-        info["links"] = list({u for u in links})
+        info["links"] = list(dict.fromkeys(links))
 
     return info
 
 
+# 旧版 observe 的失败建议：按顺序匹配命令输出
+_FAILURE_HINTS = (
+    (re.compile(r"not found|not recognized|No such file|找不到|不是内部或外部命令", re.IGNORECASE),
+     "命令或路径不存在，检查命令是否已安装、路径是否正确。"),
+    (re.compile(r"permission denied|access is denied|拒绝访问|EACCES", re.IGNORECASE),
+     "权限不足，检查文件权限或以合适的用户/权限运行。"),
+    (re.compile(r"network|timed? ?out|connection|could not resolve|SSL|网络", re.IGNORECASE),
+     "网络问题，检查网络连接、代理或镜像源后重试。"),
+)
+
+
 # @dispInfo("observer")
 def observe(task: Task, current_index: int, last_result: StepResult | None) -> Tuple[bool, bool, str]:
     """
@@ -222,18 +521,12 @@ def observe(task: Task, current_index: int, last_result: StepResult | None) -> T
     if last_result is None and current_index == 0:
         return False, False, "尚未开始执行"
     if last_result is not None and last_result.get("exit_code", -1) != 0:
-        # 失败时给一句话建议
-        try:
-            prompt = (
-                "请用一句话概括失败的原因与修复方向。\n"
-                f"命令: {last_result.get('command','')} 退出码: {last_result.get('exit_code')}\n"
-                f"STDOUT: {_short(last_result.get('stdout'))}\n"
-                f"STDERR: {_short(last_result.get('stderr'))}"
-            )
-            suggestion = llm_completion(prompt, temperature=0.2, max_tokens=80).strip()
-        except Exception:
-            suggestion = "失败，建议检查命令、权限、路径或网络。"
-        return False, True, suggestion
+        # 失败时按输出中的常见模式给一句话建议（不调用 LLM，返回值仅用于日志）
+        output = f"{last_result.get('stdout') or ''}\n{last_result.get('stderr') or ''}"
+        for pattern, suggestion in _FAILURE_HINTS:
+            if pattern.search(output):
+                return False, True, suggestion
+        return False, True, "失败，建议检查命令、权限、路径或网络。"
     if current_index >= steps_len:
         return True, False, "所有步骤执行成功"
     return False, False, f"将执行索引 {current_index}"
@@ -1,9 +1,15 @@
+import hashlib
+import itertools
+import json
+from functools import lru_cache
+import os
+from pathlib import Path
 from typing import Tuple, Optional, Dict, Any, List
-from uuid import uuid4
 from string import Template
 from config import get_config
-from utils import llm_completion
-from agent.task_types import Task, TaskStep
+from utils import llm_completion_streamed, lru_cached_llm, _DiskLLMCache, llm_embed, json_dumps, json_dumps_bounded, json_loads, extract_json_object, json_object_done
+from agent.task_types import Task, TaskStep, step_titles
+from tools.base import result_failed
 from agent.debug import dispInfo, debug
 
 PLANNER_PROMPT_TEMPLATE = Template(
@@ -141,6 +147,185 @@ PLANNER_PROMPT_TEMPLATE = Template(
 )
 
 
+# 计划缓存：以 (工作根, 目标, 模式, 规范化 facts, 已完成标题) 的指纹为键缓存规划响应，命中时不调用 LLM。
+# 周期序号不参与指纹（仅是计数，不影响规划内容）。PLAN_CACHE=0 时关闭；
+# LLM_DISK_CACHE=1 时额外持久化到 {agent_work_root}/.plan_cache.db，跨进程复用。
+_PLAN_CACHE = os.environ.get("PLAN_CACHE", "1") != "0"
+_plan_llm = None
+
+
+def _plan_llm_cached():
+    global _plan_llm
+    if _plan_llm is None:
+        disk = None
+        if os.environ.get("LLM_DISK_CACHE", "0") == "1":
+            disk = _DiskLLMCache(Path(get_config().agent_work_root) / ".plan_cache.db", 512)
+
+        # 缓存键取第一个参数（指纹）；真正的提示词通过 user_prompt 关键字传入。
+        # 只在指纹未命中时执行：先查语义层，再调用 LLM。
+        def _complete(fingerprint: str, *, user_prompt: str, semantic: Optional[Tuple[str, str, Dict[str, Any]]] = None, **kwargs) -> str:
+            vec = None
+            if semantic is not None:
+                vec, hit = _semantic_plan_lookup(*semantic)
+                if hit is not None:
+                    return hit
+            # 计划是单个 JSON 对象：流式接收，对象闭合即停止，不再等待其后的多余输出
+            resp = llm_completion_streamed(user_prompt, stop=json_object_done, stop_on="}", **kwargs)
+            if vec is not None:
+                _semantic_plan_store(vec, semantic[1], semantic[2], resp)
+            return resp
+
+        _plan_llm = lru_cached_llm(capacity=256, disk=disk)(_complete)
+    return _plan_llm
+
+
+# 语义层（可选）：PLAN_SEMANTIC_MODEL 指定 embedding 模型时启用，仅用于首次规划（无已完成步骤）。
+# 目标文本的向量与历史目标余弦相似度 ≥ 0.9 且模式相同时，复用当时的计划，
+# 并把其中的 project_root/repo_root/project_name 旧值替换为当前 facts 的值，不再调用 LLM。
+_PLAN_SEMANTIC_MODEL = os.environ.get("PLAN_SEMANTIC_MODEL", "") if _PLAN_CACHE else ""
+_PLAN_SEMANTIC_THRESHOLD = 0.9
+_PLAN_SEMANTIC_CAP = 512
+# 按值长度从长到短替换：project_root 通常包含 repo_root
+_PLAN_SLOTS = ("project_root", "repo_root", "project_name")
+# 条目：{"vec", "mode", "slots", "data", "hits"}；满了按命中次数最少者淘汰（LFU）
+_semantic_plans: List[Dict[str, Any]] = []
+
+
+def _plan_slots(facts: Dict[str, Any]) -> Dict[str, str]:
+    slots: Dict[str, str] = {}
+    for k in _PLAN_SLOTS:
+        v = facts.get(k)
+        if isinstance(v, str) and v:
+            slots[k] = v
+    return slots
+
+
+def _adapt_plan(entry: Dict[str, Any], facts: Dict[str, Any]) -> str:
+    """把缓存计划中的旧 facts 值替换为当前值，返回新的 JSON 响应文本。"""
+    new = _plan_slots(facts)
+    pairs = sorted(
+        ((old, new[k]) for k, old in entry["slots"].items() if new.get(k) and new[k] != old),
+        key=lambda p: len(p[0]), reverse=True,
+    )
+
+    def _sub(text: Any) -> Any:
+        if not isinstance(text, str):
+            return text
+        for old, cur in pairs:
+            text = text.replace(old, cur)
+        return text
+
+    data = dict(entry["data"])
+    data["steps"] = [
+        {**st, "title": _sub(st.get("title", "")), "instruction": _sub(st.get("instruction", ""))}
+        for st in data.get("steps", []) if isinstance(st, dict)
+    ]
+    return json_dumps(data)
+
+
+def _semantic_plan_lookup(goal: str, mode: str, facts: Dict[str, Any]) -> Tuple[Optional[List[float]], Optional[str]]:
+    """返回 (目标向量, 改写后的计划响应)；embedding 调用失败时两者均为 None。"""
+    try:
+        vec = llm_embed(goal, _PLAN_SEMANTIC_MODEL)
+    except Exception:
+        return None, None
+    best, best_entry = _PLAN_SEMANTIC_THRESHOLD, None
+    for entry in _semantic_plans:
+        if entry["mode"] != mode:
+            continue
+        sim = sum(a * b for a, b in zip(vec, entry["vec"]))
+        if sim >= best:
+            best, best_entry = sim, entry
+    if best_entry is None:
+        return vec, None
+    best_entry["hits"] += 1
+    debug.note("plan_semantic_hit", round(best, 4))
+    return vec, _adapt_plan(best_entry, facts)
+
+
+def _semantic_plan_store(vec: List[float], mode: str, facts: Dict[str, Any], resp: str) -> None:
+    data = _parse_plan_json(resp)
+    if not isinstance(data, dict) or not isinstance(data.get("steps"), list) or not data["steps"]:
+        return
+    if len(_semantic_plans) >= _PLAN_SEMANTIC_CAP:
+        _semantic_plans.remove(min(_semantic_plans, key=lambda e: e["hits"]))
+    _semantic_plans.append({"vec": vec, "mode": mode, "slots": _plan_slots(facts), "data": data, "hits": 0})
+
+
+def _parse_plan_json(resp: str) -> Any:
+    """
+    常见情况（整段就是一个 JSON 对象）直接解析；否则单趟扫描截取第一个完整 JSON 对象
+    （同时覆盖 markdown 代码块包裹、前后夹带说明文字的情况）。
+    """
+    text = (resp or "").strip()
+    if text.startswith("{") and text.endswith("}"):
+        try:
+            return json_loads(text)
+        except ValueError:
+            pass
+    blob = extract_json_object(text)
+    if not blob:
+        return None
+    try:
+        return json_loads(blob)
+    except ValueError:
+        return None
+
+
+def _key_facts(value: Any) -> Any:
+    """指纹用的 facts 规范化：路径分隔符统一为 /（同一路径的不同写法视为相同）。"""
+    if isinstance(value, dict):
+        return {str(k): _key_facts(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_key_facts(v) for v in value]
+    if isinstance(value, str):
+        return value.replace("\\", "/")
+    return value
+
+
+def _plan_fingerprint(
+    work_root: str,
+    goal: str,
+    mode: str,
+    facts: Dict[str, Any],
+    finished_titles: List[str],
+    context: Optional[Dict[str, Any]] = None,
+) -> str:
+    """规划缓存键：除目标/模式/facts/已完成步骤外，还包含重规划上下文（已完成/剩余步骤、上一步结果）。"""
+    ctx = context or {}
+    raw = json.dumps(
+        {
+            "root": work_root, "goal": goal, "mode": mode, "facts": _key_facts(facts), "finished": finished_titles,
+            "has_context": bool(context),
+            "completed": [s.get("title") for s in ctx.get("completed_steps", []) or []],
+            "remaining": [s.get("title") for s in ctx.get("remaining_steps", []) or []],
+            "last_result": _key_facts(ctx.get("last_result") or {}),
+        },
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+
+def _titles(steps: List[TaskStep]) -> str:
+    """步骤标题列表（逗号分隔）；无步骤时为 "(空)"。空/单步骤直接返回，不走 enumerate + join。"""
+    if not steps:
+        return "(空)"
+    if len(steps) == 1:
+        return steps[0].get("title", "步骤1") or "(空)"
+    return ", ".join(s.get("title", f"步骤{i+1}") for i, s in enumerate(steps)) or "(空)"
+
+
+# Task ID 只需进程内唯一：pid 低 16 位 + 自增序号
+_task_ids = itertools.count(1)
+
+
+@lru_cache(maxsize=128)
+def _render_planner_prompt(**fields: str) -> str:
+    """渲染规划提示词；重试/重规划时字段完全相同则直接复用上次渲染结果（字段均为字符串，可哈希）。"""
+    return PLANNER_PROMPT_TEMPLATE.safe_substitute(**fields)
+
+
 # @dispInfo("planner")
 def plan_with_llm(goal: str, context: Optional[Dict[str, Any]] = None) -> Tuple[Task, str, str]:
     """
@@ -165,17 +350,13 @@ def plan_with_llm(goal: str, context: Optional[Dict[str, Any]] = None) -> Tuple[
         remaining_steps = list(context.get("remaining_steps", []))
         last_result = dict(context.get("last_result", {}))
 
-    def _titles(steps: List[TaskStep]) -> str:
-        return ", ".join([s.get("title", f"步骤{i+1}") for i, s in enumerate(steps)]) or "(空)"
-
     # 使用模板渲染动态内容
-    import json as _json
-    user_prompt = PLANNER_PROMPT_TEMPLATE.safe_substitute(
+    user_prompt = _render_planner_prompt(
         agent_work_root=config.agent_work_root,
         goal=goal,
         mode=str(mode),
         episode=str(episode),
-        facts_json=_json.dumps(facts, ensure_ascii=False)[:4000],
+        facts_json=json_dumps_bounded(facts, 4000),
         has_context="是" if context else "否",
         completed_titles=_titles(completed_steps),
         remaining_titles=_titles(remaining_steps),
@@ -183,45 +364,27 @@ def plan_with_llm(goal: str, context: Optional[Dict[str, Any]] = None) -> Tuple[
         last_cmd=str(last_result.get("command", ""))[:200],
         last_stdout=str(last_result.get("stdout", ""))[:300],
         last_stderr=str(last_result.get("stderr", ""))[:300],
-        finished_titles_json=_json.dumps(finished_titles, ensure_ascii=False),
+        finished_titles_json=json_dumps(finished_titles),
     )
 
     # debug.note("planner_prompt", user_prompt)  # 提示词太长，不记录
-    resp = llm_completion(user_prompt, temperature=0.1, max_tokens=1000)
+    fingerprint = _plan_fingerprint(config.agent_work_root, goal, str(mode), facts, finished_titles, context)
+    plan_llm = _plan_llm_cached()
+    # 上一步失败后的重规划必须重新询问 LLM：复用缓存只会拿回刚刚失败的同一份计划
+    failed = result_failed(last_result)
+    fresh = not finished_titles and not completed_steps and not remaining_steps and not failed
+    semantic = (goal, str(mode), facts) if _PLAN_SEMANTIC_MODEL and fresh else None
+    resp = plan_llm(
+        fingerprint, user_prompt=user_prompt, semantic=semantic,
+        cacheable=_PLAN_CACHE and not failed, temperature=0.1, max_tokens=1000,
+    )
     debug.note("planner_raw_resp", resp)
-
-    # 改进的JSON解析（更强的容错性）
-    import json
-    import re
+    if debug.enabled:
+        debug.note("plan_cache", plan_llm.cache_stats())
 
     steps: list[TaskStep] = []
     plan_title = goal
-
-    # 尝试多种方式提取JSON
-    json_text = resp.strip()
-
-    # 方法1: 直接JSON解析
-    try:
-        data = json.loads(json_text)
-    except json.JSONDecodeError:
-        # 方法2: 尝试从文本中提取JSON（处理可能的markdown代码块）
-        json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', json_text, re.DOTALL)
-        if json_match:
-            try:
-                data = json.loads(json_match.group(1))
-            except json.JSONDecodeError:
-                # 方法3: 尝试找到JSON对象边界
-                start = json_text.find('{')
-                end = json_text.rfind('}') + 1
-                if start != -1 and end > start:
-                    try:
-                        data = json.loads(json_text[start:end])
-                    except json.JSONDecodeError:
-                        data = None
-                else:
-                    data = None
-        else:
-            data = None
+    data = _parse_plan_json(resp)
 
     # 解析任务数据
     if data and isinstance(data, dict):
@@ -262,17 +425,19 @@ def plan_with_llm(goal: str, context: Optional[Dict[str, Any]] = None) -> Tuple[
             **({"timeout": s["timeout"]} if "timeout" in s else {}),
         })
 
+    titles = step_titles(final_steps)
     task: Task = {
-        "id": uuid4().hex[:8],
+        "id": f"{os.getpid() & 0xFFFF:04x}{next(_task_ids) & 0xFFFF:04x}",
         "goal": goal,
         "steps": final_steps,
+        # 标题序列随任务保存：observer/executor 每轮拼提示词时直接复用
+        "titles": titles,
     }
     debug.note("final_steps", final_steps)
 
     plan_text = f"任务: {plan_title}\n共 {len(final_steps)} 个步骤。"
     if len(final_steps) > 1:
-        step_titles = [s["title"] for s in final_steps]
-        plan_text += f"\n步骤列表: {' → '.join(step_titles)}"
+        plan_text += f"\n步骤列表: {' → '.join(titles)}"
 
     return task, plan_text, resp
 
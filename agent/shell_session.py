@@ -1,33 +1,125 @@
 from __future__ import annotations
 
 import subprocess
+import itertools
+import secrets
+import shlex
 import threading
 import queue
-import uuid
+import time
 import os
 import base64
+from collections import OrderedDict
 from pathlib import Path
 from typing import Dict, Optional, Tuple
 from config import get_config
 
 
+# 每次 os.read 的最大字节数：输出多时一次系统调用取走一整块，而不是逐行读取
+_READ_CHUNK = 65536
+# 池中会话空闲超过该秒数即关闭；回收线程每 _REAP_INTERVAL 秒检查一次
+_IDLE_TTL = 300.0
+_REAP_INTERVAL = 60.0
+# 会话 ID 只需进程内唯一：pid 低 16 位 + 自增序号（按创建顺序递增，便于对日志）
+_session_ids = itertools.count(1)
+
+# 会话启动时一次性定义的收尾函数：每条命令只需发送 base64 载荷与哨兵，不再逐次拼接/解析整段包装脚本，
+# 命令内容也不会因引号不配对等问题破坏包装。命令在顶层作用域执行（dot-source / eval），变量与目录在会话内保留。
+# stdout 哨兵后紧跟 8 位十六进制退出码（32 位补码），stderr 另写一个哨兵用于确认 stderr 已读尽。
+_PS_SETUP = (
+    "$ErrorActionPreference='Continue'\n"
+    "function __AgentDecode([string]$b64) { [Text.Encoding]::UTF8.GetString([Convert]::FromBase64String($b64)) }\n"
+    "function __AgentEnd([string]$s) { "
+    "$code = if ($global:LASTEXITCODE -ne $null) { $global:LASTEXITCODE } else { 0 }; "
+    "Write-Output ('<__END__:' + $s + ':' + ('{0:x8}' -f [int]$code) + '>'); "
+    "[Console]::Error.WriteLine('<__END__:' + $s + '>') }\n"
+)
+_BASH_SETUP = (
+    "__agent_end() { local code=$?; printf '<__END__:%s:%08x>\\n' \"$1\" \"$code\"; printf '<__END__:%s>\\n' \"$1\" >&2; }\n"
+)
+
+
+def _decode_output(buf: bytearray, end: int) -> str:
+    """
+    解码本条命令的输出：截到本次哨兵（end<0 表示未出现则取全部），并跳过此前超时命令迟到的哨兵行及其之前的内容。
+
+    经 memoryview 直接解码，不先切片复制出中间 bytes；视图用完即释放，之后缓冲区仍可清空。
+    """
+    if end < 0:
+        end = len(buf)
+    start = buf.rfind(b"<__END__:", 0, end)
+    if start >= 0:
+        nl = buf.find(b"\n", start, end)
+        start = end if nl < 0 else nl + 1
+    else:
+        start = 0
+    with memoryview(buf) as view:
+        return str(view[start:end], "utf-8", "replace").strip()
+
+
 class _ProcWrapper:
-    def __init__(self, proc: subprocess.Popen, work_dir: Path) -> None:
+    def __init__(self, proc: subprocess.Popen, work_dir: Path, key: Tuple[str, str]) -> None:
         self.proc = proc
         self.work_dir = work_dir
+        self.key = key
         self.lock = threading.Lock()
+        # 命令超时或进程退出后会话状态不可信，不放回会话池
+        self.broken = False
+        # 后台线程把 stdout/stderr 原始字节整块追加到缓冲区，run_in_session 在 cond 上等待哨兵出现
+        self.cond = threading.Condition()
+        self.out = bytearray()
+        self.err = bytearray()
+        self.eof = False
+        if proc.stdin is None or proc.stdout is None or proc.stderr is None:
+            raise RuntimeError("shell 进程缺少标准输入/输出管道")
+        for stream, buf in ((proc.stdout, self.out), (proc.stderr, self.err)):
+            threading.Thread(target=self._pump, args=(stream.fileno(), buf), daemon=True).start()
+
+    def _pump(self, fd: int, buf: bytearray) -> None:
+        while True:
+            try:
+                chunk = os.read(fd, _READ_CHUNK)
+            except OSError:
+                chunk = b""
+            with self.cond:
+                if not chunk:
+                    self.eof = True
+                    self.cond.notify_all()
+                    return
+                buf += chunk
+                self.cond.notify_all()
 
 
 class ShellSessionManager:
-    """基于持久 PowerShell 进程的会话管理器。"""
+    """
+    基于持久 PowerShell 进程的会话管理器。
+
+    close_session 不直接结束进程，而是把会话放回按 (shell, cwd) 索引的空闲池（LRU，上限 config.shell_pool_max），
+    之后在同一目录 create_session 直接复用已启动的进程，省去 shell 冷启动；空闲超过 5 分钟的会话由后台定时器关闭。
+    """
 
     def __init__(self) -> None:
         self._sessions: Dict[str, _ProcWrapper] = {}
+        self._pool: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._idle_since: Dict[str, float] = {}
+        self._pool_lock = threading.Lock()
+        self._reaper: Optional[threading.Timer] = None
 
     def create_session(self, shell: str = "powershell", cwd: Optional[str] = None) -> str:
         config = get_config()
         work = Path(cwd or config.agent_work_root)
         work.mkdir(exist_ok=True)
+        key = (shell, str(work))
+
+        with self._pool_lock:
+            pooled = self._pool.pop(key, None)
+            if pooled is not None:
+                self._idle_since.pop(pooled, None)
+        if pooled is not None:
+            wrap = self._sessions.get(pooled)
+            if wrap is not None and wrap.proc.poll() is None:
+                return pooled
+            self._terminate(pooled)
 
         if os.name == 'nt':
             # 启动持久 powershell 进程（-NoExit 保持进程）
@@ -37,25 +129,25 @@ class ShellSessionManager:
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                text=True,
-                encoding="utf-8",
-                bufsize=1,
+                bufsize=0,
             )
         else:
-            # 非 Windows 简化为 /bin/bash 持久进程
+            # 非 Windows 简化为 /bin/bash 持久进程（非交互模式：不向 stderr 回显提示符与输入）
             ps = subprocess.Popen(
-                ["/bin/bash", "-i"],
+                ["/bin/bash"],
                 cwd=str(work),
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                text=True,
-                encoding="utf-8",
-                bufsize=1,
+                bufsize=0,
             )
 
-        sid = uuid.uuid4().hex[:8]
-        self._sessions[sid] = _ProcWrapper(ps, work)
+        wrap = _ProcWrapper(ps, work, key)
+        ps.stdin.write((_PS_SETUP if os.name == 'nt' else _BASH_SETUP).encode("utf-8"))
+        ps.stdin.flush()
+
+        sid = f"{os.getpid() & 0xFFFF:04x}{next(_session_ids) & 0xFFFF:04x}"
+        self._sessions[sid] = wrap
         return sid
 
     def run_in_session(self, session_id: str, command: str, timeout: int = 60) -> Tuple[int, str, str, str, str]:
@@ -64,55 +156,130 @@ class ShellSessionManager:
             raise RuntimeError("无效的 session_id")
 
         proc = wrap.proc
-        sentinel = uuid.uuid4().hex
-        ps_cmd = f"\n$ErrorActionPreference='Continue'; $global:LASTEXITCODE=$null; {command}; $code = if ($LASTEXITCODE -ne $null) {{ $LASTEXITCODE }} else {{ 0 }}; Write-Output '<__END__:{sentinel}:'+$code+'>'\n"
+        # 哨兵必须不可预测，避免与命令输出撞车
+        sentinel = secrets.token_hex(16)
+        payload = base64.b64encode(command.encode("utf-8")).decode("ascii")
+        if os.name == 'nt':
+            shell_cmd = (
+                f"\n$global:LASTEXITCODE=$null; . ([ScriptBlock]::Create((__AgentDecode '{payload}'))); "
+                f"__AgentEnd '{sentinel}'\n"
+            )
+        else:
+            shell_cmd = f"\neval \"$(printf %s {payload} | base64 -d)\"; __agent_end {sentinel}\n"
+        # 退出码定长，紧跟 stdout 哨兵直接切片解析
+        out_marker = f"<__END__:{sentinel}:".encode()
+        err_marker = f"<__END__:{sentinel}>".encode()
+        code_end = len(out_marker) + 8
 
         with wrap.lock:
-            assert proc.stdin and proc.stdout and proc.stderr
-            proc.stdin.write(ps_cmd)
-            proc.stdin.flush()
-
-            stdout_chunks: list[str] = []
-            stderr_chunks: list[str] = []
             code: Optional[int] = None
+            out_end = err_end = -1
+            # 每次唤醒只从上次扫描位置继续查找（回退 marker 长度以覆盖跨块的哨兵），不重复扫描已读输出
+            out_scan = err_scan = 0
+            with wrap.cond:
+                # 丢弃上一条命令残留的输出（如超时后才到达的内容）
+                del wrap.out[:]
+                del wrap.err[:]
+            proc.stdin.write(shell_cmd.encode("utf-8"))
+            proc.stdin.flush()
 
-            # 读取到哨兵行为止
-            proc.stdout.flush()
-            proc.stderr.flush()
-            import time
-            start = time.time()
-            while True:
-                if time.time() - start > timeout:
-                    code = -2
-                    break
-                line = proc.stdout.readline()
-                if not line:
-                    # 进程可能已退出
-                    break
-                if line.startswith(f"<__END__:{sentinel}:"):
-                    try:
-                        code = int(line.strip().split(":")[-1].rstrip(">"))
-                    except Exception:
-                        code = 0
-                    break
-                stdout_chunks.append(line)
-            # 尽量清空错误输出缓冲
-            while True:
-                try:
-                    if proc.stderr is None:
+            # 等到 stdout 与 stderr 两路哨兵都出现，保证两路输出都已读尽；超时或进程退出则提前结束
+            deadline = time.monotonic() + timeout
+            with wrap.cond:
+                while True:
+                    if out_end < 0:
+                        out_end = wrap.out.find(out_marker, out_scan)
+                        out_scan = max(0, len(wrap.out) - len(out_marker) + 1)
+                    if err_end < 0:
+                        err_end = wrap.err.find(err_marker, err_scan)
+                        err_scan = max(0, len(wrap.err) - len(err_marker) + 1)
+                    if out_end >= 0 and err_end >= 0 and len(wrap.out) >= out_end + code_end:
+                        try:
+                            code = int(wrap.out[out_end + len(out_marker):out_end + code_end], 16)
+                            if code >= 1 << 31:
+                                code -= 1 << 32
+                        except ValueError:
+                            code = 0
                         break
-                    proc.stderr.flush()
-                    if not proc.stderr.readable():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        code = -2
+                        wrap.broken = True
                         break
-                    if not proc.stderr.peek():  # type: ignore[attr-defined]
+                    if wrap.eof:
+                        wrap.broken = True
                         break
-                    stderr_chunks.append(proc.stderr.readline())
-                except Exception:
-                    break
+                    wrap.cond.wait(remaining)
+                stdout = _decode_output(wrap.out, out_end)
+                stderr = _decode_output(wrap.err, err_end)
+                del wrap.out[:]
+                del wrap.err[:]
 
-        return code or 0, "".join(stdout_chunks).strip(), "".join(stderr_chunks).strip(), command, str(wrap.work_dir)
+        return code or 0, stdout, stderr, command, str(wrap.work_dir)
 
     def close_session(self, session_id: str) -> None:
+        """结束使用会话：状态正常的会话切回初始目录后放回空闲池，否则直接关闭进程。"""
+        wrap = self._sessions.get(session_id)
+        if wrap is None:
+            return
+        limit = get_config().shell_pool_max
+        if limit <= 0 or wrap.broken or wrap.proc.poll() is not None:
+            self._terminate(session_id)
+            return
+        # 恢复工作目录，避免上一个任务的 cd 影响复用者
+        if os.name == 'nt':
+            literal = str(wrap.work_dir).replace("'", "''")
+            reset = f"Set-Location -LiteralPath '{literal}'"
+        else:
+            reset = f"cd {shlex.quote(str(wrap.work_dir))}"
+        try:
+            self.run_in_session(session_id, reset, timeout=10)
+        except Exception:
+            wrap.broken = True
+        if wrap.broken:
+            self._terminate(session_id)
+            return
+
+        evicted: list[str] = []
+        with self._pool_lock:
+            previous = self._pool.pop(wrap.key, None)
+            if previous is not None:
+                evicted.append(previous)
+            self._pool[wrap.key] = session_id
+            self._idle_since[session_id] = time.monotonic()
+            while len(self._pool) > limit:
+                _, oldest = self._pool.popitem(last=False)
+                evicted.append(oldest)
+            for sid in evicted:
+                self._idle_since.pop(sid, None)
+            if self._reaper is None:
+                self._schedule_reaper()
+        for sid in evicted:
+            self._terminate(sid)
+
+    def _schedule_reaper(self) -> None:
+        timer = threading.Timer(_REAP_INTERVAL, self._reap_idle)
+        timer.daemon = True
+        self._reaper = timer
+        timer.start()
+
+    def _reap_idle(self) -> None:
+        now = time.monotonic()
+        with self._pool_lock:
+            expired = [sid for sid, since in self._idle_since.items() if now - since > _IDLE_TTL]
+            for sid in expired:
+                self._idle_since.pop(sid, None)
+                wrap = self._sessions.get(sid)
+                if wrap is not None:
+                    self._pool.pop(wrap.key, None)
+            if self._pool:
+                self._schedule_reaper()
+            else:
+                self._reaper = None
+        for sid in expired:
+            self._terminate(sid)
+
+    def _terminate(self, session_id: str) -> None:
         wrap = self._sessions.pop(session_id, None)
         if wrap is None:
             return
@@ -120,7 +287,7 @@ class ShellSessionManager:
             if wrap.proc and wrap.proc.poll() is None:
                 try:
                     if wrap.proc.stdin:
-                        wrap.proc.stdin.write("\nexit\n")
+                        wrap.proc.stdin.write(b"\nexit\n")
                         wrap.proc.stdin.flush()
                 except Exception:
                     pass
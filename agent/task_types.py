@@ -1,4 +1,4 @@
-from typing import TypedDict, List, Optional
+from typing import NotRequired, TypedDict, List, Optional
 
 
 class TaskStep(TypedDict, total=False):
@@ -25,10 +25,26 @@ class Task(TypedDict):
     - id: 任务ID（字符串）
     - goal: 用户的任务描述
     - steps: 步骤列表
+    - titles: 可选，与 steps 一一对应的标题序列（planner 建任务时一并生成）；修改 steps 的代码须同时重建或删除该字段
     """
     id: str
     goal: str
     steps: List[TaskStep]
+    titles: NotRequired[List[str]]
+
+
+def step_titles(steps: List[TaskStep]) -> List[str]:
+    """步骤标题序列（缺标题的步骤记为“步骤N”）。"""
+    return [s.get("title", f"步骤{i+1}") for i, s in enumerate(steps)]
+
+
+def plan_titles(task: "Task") -> List[str]:
+    """返回计划步骤标题序列：任务自带的 titles 与 steps 等长时直接返回，否则现算；调用方不要修改返回的列表。"""
+    steps = task.get("steps", [])
+    titles = task.get("titles")
+    if titles is not None and len(titles) == len(steps):
+        return titles
+    return step_titles(steps)
 
 
 class StepResult(TypedDict, total=False):
@@ -1,6 +1,7 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
+from langchain_core.runnables import RunnableLambda
 from agent.task_types import AgentState
 from agent.planner import plan_with_llm
 from agent.message_utils import (
@@ -22,12 +23,13 @@ from tools import (
     GIT_REPO_STATUS_TOOL,
     GIT_ENSURE_CLONED_TOOL,
 )
-from agent.observer import observe, observe_v2
+from agent.observer import observe, observe_v2, observe_v2_async, extract_readme_info
 from agent.discover_react import run_discover_react
 import os
 import re
-from agent.executor import decide_next_action
+from agent.executor import decide_next_action, decide_next_action_async
 from config import get_config
+from utils import normalize_facts
 from agent.debug import dispInfo, debug
 
 
@@ -167,6 +169,17 @@ def discover_node(state: AgentState) -> AgentState:
     }
 
 
+def _decide_inputs(state: AgentState) -> tuple:
+    task = state.get("task", {})
+    idx = int(state.get("current_step_index", 0))
+    kwargs = {
+        "mode": str(state.get("mode", "")),
+        "episode": int(state.get("episode", 0) or 0),
+        "facts": state.get("facts", {}),
+    }
+    return (task, idx, state.get("last_result")), kwargs
+
+
 @dispInfo("workflow")
 def decide_node(state: AgentState) -> AgentState:
     """
@@ -174,19 +187,18 @@ def decide_node(state: AgentState) -> AgentState:
     - 产生工具调用（写入 messages 中的 tool_calls，由 ToolNode 执行）
     - 或请求重规划（设置 replan_requested/route）
     """
-    task = state.get("task", {})
-    steps = task.get("steps", [])
-    idx = int(state.get("current_step_index", 0))
-    last_result = state.get("last_result")
-
-    decision = decide_next_action(
-        task,
-        idx,
-        last_result,
-        mode=str(state.get("mode", "")),
-        episode=int(state.get("episode", 0) or 0),
-        facts=state.get("facts", {}),
-    )
+    args, kwargs = _decide_inputs(state)
+    return _apply_decision(state, decide_next_action(*args, **kwargs))
+
+
+@dispInfo("workflow")
+async def decide_node_async(state: AgentState) -> AgentState:
+    """decide_node 的异步版本：图以 ainvoke/astream 运行时，决策 LLM 调用不占用线程。"""
+    args, kwargs = _decide_inputs(state)
+    return _apply_decision(state, await decide_next_action_async(*args, **kwargs))
+
+
+def _apply_decision(state: AgentState, decision: Dict[str, Any]) -> AgentState:
     if decision.get("action") == "replan":
         # 请求重规划
         debug.note("route", "plan")
@@ -270,11 +282,7 @@ def decide_node(state: AgentState) -> AgentState:
     return {**state, "messages": messages, "decide_raw": decision.get("raw", "")}
 
 
-@dispInfo("workflow")
-def observe_node(state: AgentState) -> AgentState:
-    """
-    观察节点：根据 last_result 和 current_step_index 判断是否完成或失败。
-    """
+def _observe_inputs(state: AgentState) -> tuple:
     task = state["task"]
     idx = int(state.get("current_step_index", 0))
     # 从消息中提取最近一次工具结果
@@ -302,14 +310,38 @@ def observe_node(state: AgentState) -> AgentState:
             pass
 
     # 新的 LLM 路由与事实增量
-    route_decision = observe_v2(
-        task,
-        idx,
-        last_result,
-        mode=str(state.get("mode", "discover")),
-        episode=int(state.get("episode", 1) or 1),
-        facts=state.get("facts", {}),
-    )
+    kwargs = {
+        "mode": str(state.get("mode", "discover")),
+        "episode": int(state.get("episode", 1) or 1),
+        "facts": state.get("facts", {}),
+    }
+    return tool_result, (task, idx, last_result), kwargs
+
+
+@dispInfo("workflow")
+def observe_node(state: AgentState) -> AgentState:
+    """
+    观察节点：根据 last_result 和 current_step_index 判断是否完成或失败。
+    """
+    tool_result, args, kwargs = _observe_inputs(state)
+    return _apply_observation(state, tool_result, args[2], observe_v2(*args, **kwargs))
+
+
+@dispInfo("workflow")
+async def observe_node_async(state: AgentState) -> AgentState:
+    """observe_node 的异步版本：图以 ainvoke/astream 运行时，观察 LLM 调用不占用线程。"""
+    tool_result, args, kwargs = _observe_inputs(state)
+    return _apply_observation(state, tool_result, args[2], await observe_v2_async(*args, **kwargs))
+
+
+def _apply_observation(
+    state: AgentState,
+    tool_result: Optional[Dict[str, Any]],
+    last_result: Optional[Dict[str, Any]],
+    route_decision: Dict[str, Any],
+) -> AgentState:
+    task = state["task"]
+    idx = int(state.get("current_step_index", 0))
     debug.note("observation_decision", route_decision)
     obs = str(route_decision.get("notes", "")).strip() or ""
 
@@ -334,7 +366,6 @@ def observe_node(state: AgentState) -> AgentState:
         if isinstance(last_result, dict) and int(last_result.get("exit_code", -1)) == 0:
             cmd_text = str(last_result.get("command", ""))
             if cmd_text and "git clone" in cmd_text.lower():
-                import re
                 # 提取 URL 与可选目标路径（可能为 Join-Path 表达式或裸路径）
                 m = re.search(r"\bgit\s+clone\s+(\S+)(?:\s+(\([^\)]*\)|\"[^\"]+\"|'[^']+'|[^\s]+))?", cmd_text, re.IGNORECASE)
                 if m:
@@ -399,7 +430,6 @@ def observe_node(state: AgentState) -> AgentState:
     # 若上一步为读取 README 的输出，则尝试解析并合并到 READMEinfo
     readmeinfo = dict(state.get("READMEinfo", {}))
     try:
-        from agent.observer import extract_readme_info
         if isinstance(last_result, dict):
             cmd = str(last_result.get("command", ""))
             out_text = str(last_result.get("stdout", ""))
@@ -535,7 +565,6 @@ def observe_node(state: AgentState) -> AgentState:
 
     # 在返回前对 facts 进行规范化（绝对路径、占位符展开）
     try:
-        from utils import normalize_facts
         facts = normalize_facts(facts)
     except Exception:
         pass
@@ -597,7 +626,7 @@ def create_task_graph():
     workflow.add_node("discover", discover_node)
     workflow.add_node("plan", plan_node)
     # 决策节点：决定下一步调用的工具或是否重规划
-    workflow.add_node("decide", decide_node)
+    workflow.add_node("decide", RunnableLambda(decide_node, afunc=decide_node_async, name="decide"))
     # ToolNode: 暴露执行与文件系统只读工具
     workflow.add_node("execute", ToolNode([
         RUN_INSTRUCTION_TOOL,
@@ -613,7 +642,7 @@ def create_task_graph():
         GIT_REPO_STATUS_TOOL,
         GIT_ENSURE_CLONED_TOOL,
     ]))
-    workflow.add_node("observe", observe_node)
+    workflow.add_node("observe", RunnableLambda(observe_node, afunc=observe_node_async, name="observe"))
 
     workflow.set_entry_point("discover")
     workflow.add_edge("discover", "plan")
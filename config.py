@@ -47,6 +47,7 @@ class ProjectConfig(BaseSettings):
     # 运行时配置
     max_iterations: int = Field(default=10, gt=0, description="Agent最大迭代次数")
     debug_mode: bool = Field(default=False, description="调试模式")
+    shell_pool_max: int = Field(default=4, ge=0, description="空闲持久 shell 会话池上限（0 表示不复用）")
     log_level: str = Field(default="INFO", description="日志级别")
 
     # 路径配置
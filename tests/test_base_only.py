@@ -14,6 +14,7 @@ tools_base = importlib.util.module_from_spec(spec)
 spec.loader.exec_module(tools_base)
 tool_response = tools_base.tool_response
 parse_tool_response = tools_base.parse_tool_response
+parse_tool_dict = tools_base.parse_tool_dict
 
 
 def test_tool_response():
@@ -82,6 +83,20 @@ def test_parse_tool_response():
     print("  [OK] 错误信息解析")
 
 
+def test_parse_tool_dict():
+    """测试 parse_tool_dict（直接接收 dict）"""
+    print("测试 parse_tool_dict...")
+
+    raw = {"ok": True, "tool": "files_read", "data": {"content": "hello"}}
+    assert parse_tool_dict(raw) == parse_tool_response(json.dumps(raw))
+    print("  [OK] 与 parse_tool_response 结果一致")
+
+    parsed = parse_tool_dict(["not", "a", "dict"])
+    assert parsed["ok"] == False
+    assert parsed["error"] == "invalid_json"
+    print("  [OK] 非 dict 输入处理")
+
+
 def test_unified_format_structure():
     """验证统一格式结构"""
     print("验证统一格式结构...")
@@ -124,6 +139,7 @@ if __name__ == "__main__":
     try:
         test_tool_response()
         test_parse_tool_response()
+        test_parse_tool_dict()
         test_unified_format_structure()
         
         print("\n" + "="*60)
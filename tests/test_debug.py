@@ -0,0 +1,86 @@
+"""测试 agent.debug：并发子任务的调用栈隔离、方法绑定与协程识别、日志实时落盘"""
+import asyncio
+import inspect
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+import agent.debug as dbg
+
+
+def _record_ends(monkeypatch):
+    records = []
+    original = dbg.debug.end
+
+    def _spy(return_value=None, exception=None):
+        top = dbg._stack_var.get()[-1]
+        records.append((top.func_name, [v for _, v in top.notes]))
+        original(return_value, exception)
+
+    monkeypatch.setattr(dbg.debug, "end", _spy)
+    return records
+
+
+def test_gathered_children_keep_separate_stacks(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dbg, "DEBUG_ENABLED", True)
+    records = _record_ends(monkeypatch)
+
+    @dbg.dispInfo("t")
+    async def child(name):
+        dbg.debug.note("n", name + "1")
+        await asyncio.sleep(0.01 if name == "a" else 0)
+        dbg.debug.note("n", name + "2")
+        return name
+
+    @dbg.dispInfo("t")
+    async def parent():
+        dbg.debug.note("p", "p1")
+        out = await asyncio.gather(child("a"), child("b"))
+        dbg.debug.note("p", "p2")
+        return out
+
+    assert asyncio.run(parent()) == ["a", "b"]
+    assert sorted(records[:2]) == [("child", ["a1", "a2"]), ("child", ["b1", "b2"])]
+    assert records[2] == ("parent", ["p1", "p2"])
+    assert dbg._stack_var.get() == ()
+
+
+def test_wrappers_bind_methods_and_stay_async(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dbg, "DEBUG_ENABLED", True)
+
+    class C:
+        @dbg.dispInfo("m")
+        def double(self, y):
+            return y * 2
+
+    @dbg.dispInfo("a")
+    async def coro(x):
+        return x
+
+    assert C().double(3) == 6
+    assert C.double(C(), 4) == 8
+    assert inspect.iscoroutinefunction(coro)
+    assert asyncio.run(coro(5)) == 5
+
+
+def test_log_record_visible_before_exit(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dbg, "DEBUG_ENABLED", True)
+    manager = dbg.DebugInfoManager()
+    manager.start("t", "f", (), {"x": 1})
+    manager.end("done")
+    # 不关闭句柄、不等 atexit：记录已落盘
+    assert "done" in (tmp_path / ".agent_debug.log").read_text(encoding="utf-8")
+    manager._log_fh.close()
+
+
+def test_bounded_serialize_redacts_and_stops_early():
+    payload = {"api_key": "sk-live", "rows": [{"i": i, "text": "x" * 100} for i in range(10000)]}
+    text = dbg._safe_serialize_redact(payload, limit=300)
+    assert "sk-live" not in text and '"api_key": "***"' in text
+    assert text.endswith("…(截断)") and len(text) <= 300 + len("…(截断)")
@@ -0,0 +1,29 @@
+"""测试 discover 的检查点：同一 thread_id 的已完成运行再次调用时从空白状态开始"""
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+import agent.discover_react as dr
+
+
+def test_finished_thread_restarts_fresh(monkeypatch):
+    saver = InMemorySaver()
+    replies = iter(["Thought: look\nAction: files_list(path=\".\")", "Thought: done\nAction: finish"] * 2)
+    monkeypatch.setattr(dr, "_sqlite_checkpointer", lambda: saver)
+    monkeypatch.setattr(dr, "cached_llm_completion_streamed", lambda prompt, **kwargs: next(replies))
+    monkeypatch.setattr(dr, "llm_completion", lambda prompt, **kwargs: "summary")
+
+    first = dr.run_discover_react("test_checkpoint_goal", thread_id="t-restart")
+    second = dr.run_discover_react("test_checkpoint_goal", thread_id="t-restart")
+
+    assert first["summary"] == second["summary"] == "summary"
+    # 追加型 reducer 不得把上一轮的记录、上下文窗口带进新一轮
+    assert len(second["transcript"]) == len(first["transcript"]) > 0
+    assert second["raw_state"].get("ctx_window") == first["raw_state"].get("ctx_window")
+    config = {"configurable": {"thread_id": "t-restart"}}
+    assert len(dr.create_discover_graph(saver).get_state(config).values["transcript"]) == len(first["transcript"])
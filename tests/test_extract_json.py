@@ -0,0 +1,40 @@
+"""测试 utils.extract_json_object 的花括号扫描"""
+import json
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from utils import extract_json_object
+
+
+def test_plain_object_and_leading_prose():
+    assert extract_json_object('{"a": 1}') == '{"a": 1}'
+    text = '好的，计划如下：\n```json\n{"title": "t", "steps": []}\n```\n以上'
+    assert json.loads(extract_json_object(text)) == {"title": "t", "steps": []}
+
+
+def test_braces_inside_strings():
+    blob = '{"cmd": "echo }{ done", "nested": {"x": "{"}}'
+    assert extract_json_object("前缀 " + blob + " 后缀") == blob
+    assert json.loads(blob)["cmd"] == "echo }{ done"
+
+
+def test_escaped_quotes_and_backslashes():
+    blob = r'{"a": "say \"}\" now", "path": "C:\\dir\\", "b": 2}'
+    assert extract_json_object(blob + " trailing }") == blob
+    assert json.loads(blob) == {"a": 'say "}" now', "path": "C:\\dir\\", "b": 2}
+
+
+def test_multiple_objects_returns_first():
+    assert extract_json_object('{"first": 1} {"second": 2}') == '{"first": 1}'
+    assert extract_json_object('x {"a": {"b": {}}} y {"c": 3}') == '{"a": {"b": {}}}'
+
+
+def test_unbalanced_or_missing():
+    assert extract_json_object("") is None
+    assert extract_json_object("no json here }") is None
+    assert extract_json_object('{"a": {"b": 1}') is None
+    assert extract_json_object('{"a": "unterminated }') is None
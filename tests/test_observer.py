@@ -0,0 +1,52 @@
+"""测试 agent.observer 的路由：规则路由与语义缓存的作用域"""
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+import agent.observer as observer
+
+_TASK = {"goal": "test_observer_goal", "steps": [{"title": "a"}, {"title": "b"}]}
+_OK = {"ok": True, "tool": "shell", "data": {"exit_code": 0}, "error": None}
+_FAILED = {"ok": False, "tool": "shell", "data": {"exit_code": 1}, "error": "boom"}
+
+
+def test_semantic_cache_scoped_by_step_and_success(monkeypatch):
+    calls = []
+
+    def _complete(prompt, **kwargs):
+        calls.append(prompt)
+        return '{"route": "end", "success": true}'
+
+    monkeypatch.setattr(observer, "_SEMANTIC_MODEL", "test-embedding")
+    # 所有提示词都得到同一向量：只有作用域能阻止误命中
+    monkeypatch.setattr(observer, "llm_embed", lambda text, model: [1.0, 0.0])
+    monkeypatch.setattr(observer, "cached_llm_completion_streamed", _complete)
+    observer.observer_cache_clear()
+
+    def _observe(idx, result):
+        return observer.observe_v2(_TASK, idx, result, mode="discover", episode=1, facts={})
+
+    _observe(0, _OK)
+    _observe(0, _OK)
+    assert len(calls) == 1
+    # 失败结果不复用成功时的路由，也不写入语义缓存
+    _observe(0, _FAILED)
+    assert len(calls) == 2
+    # 步骤索引不同同样不复用
+    _observe(1, _OK)
+    assert len(calls) == 3
+
+    observer.observer_cache_clear(_TASK["goal"])
+    assert observer.observer_cache_stats()["semantic_size"] == 0
+
+
+def test_rule_end_reads_exit_code_from_tool_data():
+    task = {"goal": "g", "steps": [{"title": "a"}]}
+    done = observer._try_rule_based_route(task, 1, _OK, "execute", {})
+    assert done is not None and done["route"] == "end" and done["notes"] == "rule:end"
+    # 未越过全部步骤或执行失败时不触发
+    assert observer._try_rule_based_route(task, 1, _FAILED, "execute", {}) is None
+    assert observer._try_rule_based_route({"goal": "g", "steps": [{}, {}]}, 1, _OK, "execute", {}) is None
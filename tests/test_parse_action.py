@@ -0,0 +1,42 @@
+"""测试 discover_react._parse_action 的 Action 行解析"""
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from agent.discover_react import _parse_action
+
+
+def test_finish_and_invalid():
+    assert _parse_action("Action: finish") == {"type": "finish"}
+    assert _parse_action("") == {"type": "invalid"}
+    assert _parse_action("Action: 看一下目录") == {"type": "invalid"}
+
+
+def test_basic_kwargs():
+    parsed = _parse_action('Action: Action: files_read(path="repo_root/README.md", mode="head")')
+    assert parsed == {"type": "tool", "name": "files_read", "args": {"path": "repo_root/README.md", "mode": "head"}}
+
+    parsed = _parse_action("files_read_section(path='repo_root/README.md', start_line=20, end_line=80)")
+    assert parsed["args"] == {"path": "repo_root/README.md", "start_line": 20, "end_line": 80}
+
+    assert _parse_action("md_outline()")["args"] == {}
+
+
+def test_windows_paths_and_quoted_commas():
+    # 结尾反斜杠不会被当作转义吞掉右引号
+    parsed = _parse_action(r'files_list(path="C:\Users\dev\proj\")')
+    assert parsed["args"] == {"path": "C:\\Users\\dev\\proj\\"}
+    # \a、\b 等转义序列同样按字面保留，不会变成控制字符
+    parsed = _parse_action(r'files_read(path="C:\a\b.md")')
+    assert parsed["args"] == {"path": "C:\\a\\b.md"}
+
+    parsed = _parse_action('files_grep(pattern="a, b", path=repo_root, ignore_case=True)')
+    assert parsed["args"] == {"pattern": "a, b", "path": "repo_root", "ignore_case": True}
+
+
+def test_nested_quotes():
+    assert _parse_action("""x(q='say "hi"')""")["args"] == {"q": 'say "hi"'}
+    assert _parse_action('''x(path="it's")''')["args"] == {"path": "it's"}
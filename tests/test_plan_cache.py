@@ -0,0 +1,49 @@
+"""测试 planner 的规划缓存：失败后的重规划不得复用缓存中的同一份计划"""
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+import agent.planner as planner
+
+
+def _fake_llm(calls):
+    def _complete(prompt, **kwargs):
+        calls.append(prompt)
+        return '{"title": "t", "steps": [{"title": "install %d", "instruction": "pip install ."}]}' % len(calls)
+    return _complete
+
+
+def test_replan_after_failure_calls_llm_again(monkeypatch):
+    calls = []
+    monkeypatch.setattr(planner, "llm_completion_streamed", _fake_llm(calls))
+    context = {
+        "mode": "execute",
+        "facts": {},
+        "completed_steps": [],
+        "remaining_steps": [{"id": 1, "title": "install", "instruction": "pip install ."}],
+        "last_result": {"ok": False, "tool": "shell", "data": {"exit_code": 1, "stderr": "boom"}},
+    }
+    first, _, _ = planner.plan_with_llm("test_replan_after_failure", context)
+    second, _, _ = planner.plan_with_llm("test_replan_after_failure", context)
+    assert len(calls) == 2
+    assert first["steps"][0]["title"] != second["steps"][0]["title"]
+
+
+def test_identical_fresh_plan_is_cached(monkeypatch):
+    calls = []
+    monkeypatch.setattr(planner, "llm_completion_streamed", _fake_llm(calls))
+    context = {"mode": "execute", "facts": {"repo_root": "C:\\work\\repo"}}
+    planner.plan_with_llm("test_fresh_plan_cached", context)
+    planner.plan_with_llm("test_fresh_plan_cached", context)
+    assert len(calls) == 1
+
+
+def test_fingerprint_includes_replan_context():
+    base = planner._plan_fingerprint("w", "g", "execute", {}, [])
+    ctx = {"remaining_steps": [{"title": "install"}], "last_result": {"exit_code": 1}}
+    assert planner._plan_fingerprint("w", "g", "execute", {}, [], ctx) != base
+    other = {"remaining_steps": [{"title": "install"}], "last_result": {"exit_code": 2}}
+    assert planner._plan_fingerprint("w", "g", "execute", {}, [], ctx) != planner._plan_fingerprint("w", "g", "execute", {}, [], other)
@@ -0,0 +1,51 @@
+"""测试 observer.extract_readme_info 的 README 字段提取"""
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from agent.observer import extract_readme_info
+
+
+README = """# Demo
+
+A small tool.
+Second line.
+
+## Install
+- pip install demo
+* conda install demo
+pip install demo[extra]
+
+python -m demo
+pytest -q
+Requires Python >= 3.9
+Docs: [site](https://demo.io/docs) and [repo](https://github.com/x/demo)
+"""
+
+
+def test_title_and_description():
+    info = extract_readme_info(README)
+    assert info["project_name"] == "Demo"
+    assert info["description"] == "A small tool. Second line."
+    assert info["python_min_version"] == "3.9"
+
+
+def test_commands_deduped_in_order():
+    info = extract_readme_info(README)
+    assert info["install_cmds"] == ["pip", "conda"]
+    assert info["run_cmds"] == ["python -m demo", "pytest -q"]
+    assert info["links"] == ["https://demo.io/docs", "https://github.com/x/demo"]
+
+
+def test_empty():
+    assert extract_readme_info("") == {}
+    assert extract_readme_info(None) == {}
+
+
+def test_entry_points_only_from_command_context():
+    readme = "# Tool\n\nThe tool is fast.\n\nUsage: mytool run\nCall `mytool-cli --help` first.\n```bash\n$ mytool serve\n# comment\n```\nAfter the block.\n"
+    info = extract_readme_info(readme)
+    assert info["entry_points"] == ["mytool", "mytool-cli"]
@@ -0,0 +1,75 @@
+"""测试 agent.shell_session 的持久会话（bash 路径）：退出码、输出分流、超时后的迟到哨兵与会话池复用"""
+import os
+import sys
+import time
+
+import pytest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from agent.shell_session import ShellSessionManager
+
+pytestmark = pytest.mark.skipif(os.name == "nt" or not os.path.exists("/bin/bash"), reason="需要 /bin/bash")
+
+
+@pytest.fixture
+def manager():
+    mgr = ShellSessionManager()
+    yield mgr
+    for sid in list(mgr._sessions):
+        mgr._terminate(sid)
+
+
+def test_exit_code_and_stream_separation(manager, tmp_path):
+    sid = manager.create_session(cwd=str(tmp_path))
+    code, out, err, command, work_dir = manager.run_in_session(sid, "echo out; echo err >&2; (exit 3)")
+    assert (code, out, err) == (3, "out", "err")
+    assert command == "echo out; echo err >&2; (exit 3)"
+    assert work_dir == str(tmp_path)
+
+    code, out, err, _, _ = manager.run_in_session(sid, "true")
+    assert (code, out, err) == (0, "", "")
+
+
+def test_non_ascii_output_and_unbalanced_quotes(manager, tmp_path):
+    sid = manager.create_session(cwd=str(tmp_path))
+    code, out, _, _, _ = manager.run_in_session(sid, "X='中文 ✓'; echo \"$X\"")
+    assert (code, out) == (0, "中文 ✓")
+    # 变量在会话内保留
+    assert manager.run_in_session(sid, 'echo "$X"')[1] == "中文 ✓"
+    # 引号不配对只会让该命令报错，不会吞掉哨兵导致卡到超时
+    code, _, err, _, _ = manager.run_in_session(sid, "echo 'unbalanced", timeout=10)
+    assert code == 2 and err
+
+
+def test_timeout_then_late_sentinel(manager, tmp_path):
+    sid = manager.create_session(cwd=str(tmp_path))
+    code, _, _, _, _ = manager.run_in_session(sid, "sleep 1; echo late; echo late-err >&2", timeout=0.2)
+    assert code == -2
+    # 上一条命令的输出与哨兵迟到，不得混入下一条命令的结果
+    time.sleep(1.2)
+    code, out, err, _, _ = manager.run_in_session(sid, "echo next")
+    assert (code, out, err) == (0, "next", "")
+    # 不等待迟到输出、紧接着执行时同样不串
+    manager.run_in_session(sid, "sleep 0.5; echo late2", timeout=0.1)
+    code, out, err, _, _ = manager.run_in_session(sid, "echo again")
+    assert (code, out, err) == (0, "again", "")
+
+
+def test_pooled_session_reused_with_reset_cwd(manager, tmp_path):
+    sid = manager.create_session(cwd=str(tmp_path))
+    manager.run_in_session(sid, "cd /")
+    manager.close_session(sid)
+
+    reused = manager.create_session(cwd=str(tmp_path))
+    assert reused == sid
+    assert manager.run_in_session(reused, "pwd")[1] == str(tmp_path)
+
+    # 正在使用的会话不会被再次分配；超时过的会话不放回池中
+    other = manager.create_session(cwd=str(tmp_path))
+    assert other != reused
+    manager.run_in_session(other, "sleep 1", timeout=0.1)
+    manager.close_session(other)
+    assert other not in manager._sessions
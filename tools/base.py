@@ -32,6 +32,36 @@ def tool_response(
     return json.dumps(result, ensure_ascii=False)
 
 
+def parse_tool_dict(result: Dict[str, Any]) -> Dict[str, Any]:
+    """从已解析的工具返回字典中提取统一字段（调用方已持有 dict 时无需再 dumps/loads 一轮）
+    
+    Returns:
+        {
+            "ok": bool,
+            "tool": str,
+            "data": dict,
+            "error": str | None
+        }
+    """
+    if not isinstance(result, dict):
+        return _invalid_response()
+    return {
+        "ok": result.get("ok", False),
+        "tool": result.get("tool", "unknown"),
+        "data": result.get("data", {}),
+        "error": result.get("error"),
+    }
+
+
+def _invalid_response() -> Dict[str, Any]:
+    return {
+        "ok": False,
+        "tool": "unknown",
+        "data": {},
+        "error": "invalid_json"
+    }
+
+
 def parse_tool_response(json_str: str) -> Dict[str, Any]:
     """解析工具返回
     
@@ -45,17 +75,20 @@ def parse_tool_response(json_str: str) -> Dict[str, Any]:
     """
     try:
         result = json.loads(json_str)
-        return {
-            "ok": result.get("ok", False),
-            "tool": result.get("tool", "unknown"),
-            "data": result.get("data", {}),
-            "error": result.get("error"),
-        }
     except Exception:
-        return {
-            "ok": False,
-            "tool": "unknown",
-            "data": {},
-            "error": "invalid_json"
-        }
+        return _invalid_response()
+    return parse_tool_dict(result)
 
+
+def result_failed(result: Optional[Dict[str, Any]]) -> bool:
+    """上一次结果是否失败：兼容工具返回（ok=False 或 data.exit_code 非 0）与 StepResult（顶层 exit_code 非 0）两种结构。"""
+    if not isinstance(result, dict) or not result:
+        return False
+    if result.get("ok") is False:
+        return True
+    data = result.get("data")
+    code = result.get("exit_code", data.get("exit_code") if isinstance(data, dict) else None)
+    try:
+        return code not in (None, "") and int(code) != 0
+    except (TypeError, ValueError):
+        return False
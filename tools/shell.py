@@ -33,7 +33,7 @@ from langchain_core.tools import tool
 
 from config import get_config
 from agent.debug import dispInfo, debug
-from agent.async_utils import run_coro_sync
+from agent.async_utils import run_coro_sync, ensure_background_loop
 from tools.base import tool_response
 
 
@@ -550,6 +550,8 @@ def _sanitize_ps_cmd(ps_cmd: str, repo_root: str, project_root: str) -> str:
 # ============================================================================
 
 _sessions: Dict[str, PowerShellSession] = {}
+# 会话 token -> 创建该会话的后台事件循环（asyncio 子进程与锁只能在原循环上使用）
+_session_loops: Dict[str, asyncio.AbstractEventLoop] = {}
 
 
 @dispInfo("run_single")
@@ -587,6 +589,9 @@ async def run_single(
             current_token = session.token
         else:
             current_token = session_token
+    # 旧 token 已失效（未知或已重建）：同时移除其事件循环映射，避免字典无限增长、继续钉住旧循环
+    if session_token is not None and session_token != current_token:
+        _session_loops.pop(session_token, None)
 
     # 执行
     result = await session.run(nl_instruction, timeout=timeout)
@@ -624,10 +629,13 @@ def RUN_INSTRUCTION_TOOL(
         pass
 
     try:
+        loop = _session_loops.get(session_token or "") or ensure_background_loop()
         token, result = run_coro_sync(
             run_single(nl_instruction, timeout=timeout, session_token=session_token),
             timeout=timeout + 5,
+            loop=loop,
         )
+        _session_loops[token] = loop
         # result 包含: exit_code, stdout, stderr, command, work_dir, start_dir, end_dir
         try:
             debug.note("session_token_out", token)
@@ -1,10 +1,24 @@
 
 import openai
 from config import get_llm_config, get_config
+import asyncio
+import functools
+import hashlib
+import io
+import json
 import os
+import sqlite3
+import threading
 import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, Any
+from typing import Callable, Dict, Any, Literal
+
+# 可选依赖：装了 orjson 时 json_dumps/json_loads 走它，否则使用标准库 json
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
 
 def llm_completion(prompt: str, **kwargs) -> str:
     """
@@ -14,6 +28,8 @@ def llm_completion(prompt: str, **kwargs) -> str:
         prompt: 用户提示
         **kwargs: 覆盖默认配置的参数，如temperature, max_tokens等
             - max_retries: 最大重试次数，默认为3次（当遇到429错误时）
+            - tier: 模型档位，"strong"（默认）或 "fast"，见 _resolve_model
+            - system: 可选的 system 提示词（固定不变的指令/工具清单），prompt 作为 user 消息
 
     Returns:
         str: LLM的响应内容
@@ -39,47 +55,13 @@ def llm_completion(prompt: str, **kwargs) -> str:
         api_key=llm_config.api_key,
         base_url=llm_config.base_url,
     )
-
-    # 合并默认配置和覆盖参数
-    request_params = {
-        "model": llm_config.model_name,
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": kwargs.get('temperature', llm_config.temperature),
-        "max_tokens": kwargs.get('max_tokens', llm_config.max_tokens),
-    }
-
-    # 添加其他可选参数
-    for key in ['temperature', 'max_tokens', 'timeout']:
-        if key in kwargs and key not in request_params:
-            request_params[key] = kwargs[key]
+    request_params = _build_request_params(prompt, kwargs)
 
     # 重试逻辑
     max_retries = kwargs.get('max_retries', 8)  # 默认最大重试8次
     retry_count = 0
 
-    # LLM 调用前记录到独立日志文件（不在调试栈里，以避免过量日志），仅截断超长内容
-    def _write_llm_log(kind: str, payload: Dict[str, Any]) -> None:
-        try:
-            ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-            with open(".agent_llm.log", "a", encoding="utf-8") as f:
-                f.write(f"[{ts}] {kind} ")
-                # 简单脱敏：不写入 api_key；messages 中只写入 user 内容
-                safe = dict(payload)
-                try:
-                    if "messages" in safe:
-                        msgs = safe.get("messages") or []
-                        safe["messages"] = [{"role": m.get("role"), "content": (m.get("content") or "")[:4000]} for m in msgs]
-                    if "api_key" in safe:
-                        safe["api_key"] = "***"
-                except Exception:
-                    pass
-                import json as _json
-                f.write(_json.dumps(safe, ensure_ascii=False, default=str))
-                f.write("\n")
-        except Exception:
-            pass
-
-    _write_llm_log("REQUEST", {"model": request_params.get("model"), "messages": request_params.get("messages"), "temperature": request_params.get("temperature"), "max_tokens": request_params.get("max_tokens")})
+    _log_llm_request(request_params)
 
     while retry_count <= max_retries:
         try:
@@ -102,6 +84,472 @@ def llm_completion(prompt: str, **kwargs) -> str:
             raise e
 
 
+async def llm_acompletion(prompt: str, **kwargs) -> str:
+    """
+    llm_completion 的异步版本（参数、重试与日志行为一致）。
+
+    供异步图节点使用：多个目标并发运行时，各自的 LLM 网络等待可以相互重叠。
+    """
+    llm_config = get_llm_config()
+
+    client = openai.AsyncOpenAI(
+        api_key=llm_config.api_key,
+        base_url=llm_config.base_url,
+    )
+    request_params = _build_request_params(prompt, kwargs)
+
+    max_retries = kwargs.get('max_retries', 8)
+    retry_count = 0
+
+    _log_llm_request(request_params)
+
+    try:
+        while retry_count <= max_retries:
+            try:
+                resp = await client.chat.completions.create(**request_params)
+                text = resp.choices[0].message.content
+                _write_llm_log("RESPONSE", {"model": request_params.get("model"), "content": (text or "")[:8000]})
+                return text
+            except openai.RateLimitError as e:
+                retry_count += 1
+                if retry_count <= max_retries:
+                    print(f"遇到请求频率限制 (429)，等待5秒后重试 ({retry_count}/{max_retries})")
+                    await asyncio.sleep(5)
+                else:
+                    print(f"已达到最大重试次数 ({max_retries})，请求失败")
+                    _write_llm_log("ERROR", {"type": "RateLimitError", "message": str(e)[:1000]})
+                    raise e
+            except Exception as e:
+                _write_llm_log("ERROR", {"type": type(e).__name__, "message": str(e)[:1000]})
+                raise e
+    finally:
+        await client.close()
+
+
+def llm_completion_streamed(prompt: str, stop: Callable[[str], bool] | None = None, stop_on: str = "\n", **kwargs) -> str:
+    """
+    以流式方式调用 LLM，边收边拼接；stop(已收到的文本) 为真时立即关闭流并返回已收到的部分。
+
+    适合调用方只需要响应开头（如 ReAct 的 Thought/Action 行、单个 JSON 对象）的场景：不必等待、
+    也不必为 max_tokens 剩余的尾部生成付费。stop 只在增量片段包含 stop_on 时检查（默认换行，
+    JSON 响应可传 "}"）。流式请求在收到任何内容之前失败时回退到 llm_completion。
+    """
+    llm_config = get_llm_config()
+    client = openai.OpenAI(
+        api_key=llm_config.api_key,
+        base_url=llm_config.base_url,
+    )
+    request_params = _build_request_params(prompt, kwargs)
+    _log_llm_request(request_params)
+
+    parts: list[str] = []
+    try:
+        stream = client.chat.completions.create(**request_params, stream=True)
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                parts.append(delta)
+                if stop is not None and stop_on in delta and stop("".join(parts)):
+                    break
+        finally:
+            stream.close()
+    except Exception as e:
+        if parts:
+            _write_llm_log("ERROR", {"type": type(e).__name__, "message": str(e)[:1000], "streamed": True})
+        else:
+            return llm_completion(prompt, **kwargs)
+    text = "".join(parts)
+    _write_llm_log("RESPONSE", {"model": request_params.get("model"), "content": text[:8000], "streamed": True})
+    return text
+
+
+async def llm_acompletion_streamed(prompt: str, stop: Callable[[str], bool] | None = None, stop_on: str = "\n", **kwargs) -> str:
+    """llm_completion_streamed 的异步版本；收到内容前失败时回退到 llm_acompletion。"""
+    llm_config = get_llm_config()
+    client = openai.AsyncOpenAI(
+        api_key=llm_config.api_key,
+        base_url=llm_config.base_url,
+    )
+    request_params = _build_request_params(prompt, kwargs)
+    _log_llm_request(request_params)
+
+    parts: list[str] = []
+    try:
+        stream = await client.chat.completions.create(**request_params, stream=True)
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                parts.append(delta)
+                if stop is not None and stop_on in delta and stop("".join(parts)):
+                    break
+        finally:
+            await stream.close()
+    except Exception as e:
+        if parts:
+            _write_llm_log("ERROR", {"type": type(e).__name__, "message": str(e)[:1000], "streamed": True})
+        else:
+            await client.close()
+            return await llm_acompletion(prompt, **kwargs)
+    await client.close()
+    text = "".join(parts)
+    _write_llm_log("RESPONSE", {"model": request_params.get("model"), "content": text[:8000], "streamed": True})
+    return text
+
+
+# 模型档位 -> 环境变量：fast 用于选动作/决策等短输出调用，strong 用于总结等需要完整推理的调用
+_MODEL_TIER_ENV = {"fast": "LLM_MODEL_FAST", "strong": "LLM_MODEL_STRONG"}
+
+
+def _resolve_model(tier: Literal["fast", "strong"] = "strong") -> str:
+    """按档位取模型名：LLM_MODEL_STRONG 未设置时用配置中的 model_name，LLM_MODEL_FAST 未设置时与 strong 相同。"""
+    strong = os.environ.get(_MODEL_TIER_ENV["strong"]) or get_llm_config().model_name
+    if tier == "fast":
+        return os.environ.get(_MODEL_TIER_ENV["fast"]) or strong
+    return strong
+
+
+def llm_embed(text: str, model: str) -> list[float]:
+    """调用提供方的 embedding 接口，返回 L2 归一化后的向量（点积即余弦相似度）。"""
+    llm_config = get_llm_config()
+    client = openai.OpenAI(
+        api_key=llm_config.api_key,
+        base_url=llm_config.base_url,
+    )
+    vec = client.embeddings.create(model=model, input=text).data[0].embedding
+    norm = sum(x * x for x in vec) ** 0.5 or 1.0
+    return [x / norm for x in vec]
+
+
+def _build_messages(prompt: str, system: str | None = None) -> list[Dict[str, Any]]:
+    # 静态内容放在 system 前缀、动态内容放在 user 消息里，服务端的前缀缓存才能命中
+    if system:
+        return [{"role": "system", "content": system}, {"role": "user", "content": prompt}]
+    return [{"role": "user", "content": prompt}]
+
+
+def _build_request_params(prompt: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    llm_config = get_llm_config()
+
+    # 合并默认配置和覆盖参数
+    request_params = {
+        "model": _resolve_model(kwargs.get('tier', "strong")),
+        "messages": _build_messages(prompt, kwargs.get('system')),
+        "temperature": kwargs.get('temperature', llm_config.temperature),
+        "max_tokens": kwargs.get('max_tokens', llm_config.max_tokens),
+    }
+
+    # 添加其他可选参数
+    for key in ['temperature', 'max_tokens', 'timeout']:
+        if key in kwargs and key not in request_params:
+            request_params[key] = kwargs[key]
+    return request_params
+
+
+# LLM 调用前记录到独立日志文件（不在调试栈里，以避免过量日志），仅截断超长内容
+def _write_llm_log(kind: str, payload: Dict[str, Any]) -> None:
+    try:
+        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        with open(".agent_llm.log", "a", encoding="utf-8") as f:
+            f.write(f"[{ts}] {kind} ")
+            # 简单脱敏：不写入 api_key；messages 中只写入 user 内容
+            safe = dict(payload)
+            try:
+                if "messages" in safe:
+                    msgs = safe.get("messages") or []
+                    safe["messages"] = [{"role": m.get("role"), "content": (m.get("content") or "")[:4000]} for m in msgs]
+                if "api_key" in safe:
+                    safe["api_key"] = "***"
+            except Exception:
+                pass
+            f.write(json.dumps(safe, ensure_ascii=False, default=str))
+            f.write("\n")
+    except Exception:
+        pass
+
+
+def _log_llm_request(request_params: Dict[str, Any]) -> None:
+    _write_llm_log("REQUEST", {"model": request_params.get("model"), "messages": request_params.get("messages"), "temperature": request_params.get("temperature"), "max_tokens": request_params.get("max_tokens")})
+
+
+def json_dumps(obj: Any) -> str:
+    """编码为 JSON 文本（UTF-8 字符原样保留）；优先 orjson（紧凑格式），不支持的对象回退到标准库。"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False)
+
+
+_BOUNDED_ENCODER = json.JSONEncoder(ensure_ascii=False)
+
+
+def json_dumps_bounded(obj: Any, limit: int) -> str:
+    """
+    等价于 json_dumps(obj)[:limit]，但只解码/拼接前 limit 个字符。
+
+    orjson 可用时整体编码（C 实现足够快），只解码前 4*limit 字节（UTF-8 每字符至多 4 字节）；
+    回退到标准库时流式编码，写满 limit 个字符即停止，不序列化会被截掉的部分。
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)[: 4 * limit].decode("utf-8", errors="ignore")[:limit]
+        except TypeError:
+            pass
+    buf = io.StringIO()
+    for chunk in _BOUNDED_ENCODER.iterencode(obj):
+        buf.write(chunk)
+        if buf.tell() >= limit:
+            break
+    return buf.getvalue()[:limit]
+
+
+def json_loads(text: str | bytes) -> Any:
+    """解析 JSON；优先 orjson，orjson 拒绝的输入（NaN、超长整数等）再交给标准库，语义与 json.loads 一致。"""
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
+
+def extract_json_object(text: str) -> str | None:
+    """
+    从 LLM 响应中截取第一个完整的 JSON 对象文本（如 "好的：{...} 以上" 中的 {...}）。
+
+    单次前向扫描：记录花括号深度，跳过字符串字面量内的括号与转义字符；
+    深度回到 0 时返回该片段，找不到完整对象时返回 None。
+    """
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    in_str = False
+    escape = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_str:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+def json_object_done(text: str) -> bool:
+    """流式 stop 条件：已收到一个完整的 JSON 对象。"""
+    return extract_json_object(text) is not None
+
+
+class _LLMCache:
+    """进程内 prompt→completion 精确 LRU 缓存（OrderedDict + 锁，线程安全）。"""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._data: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            text = self._data.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, key: str, text: str) -> None:
+        with self._lock:
+            self._data[key] = text
+            self._data.move_to_end(key)
+            if len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+class _DiskLLMCache:
+    """
+    sqlite 持久化的 prompt→completion 缓存，供跨进程复用（同一仓库反复运行时的相同提示词）。
+
+    按最近访问时间保留 capacity 条；数据库打不开或读写出错时静默视为未命中。
+    """
+
+    def __init__(self, path: Path, capacity: int) -> None:
+        self.path = path
+        self.capacity = capacity
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, text TEXT NOT NULL, atime REAL NOT NULL)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> str | None:
+        try:
+            with self._lock:
+                db = self._db()
+                row = db.execute("SELECT text FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                db.execute("UPDATE llm_cache SET atime = ? WHERE key = ?", (time.time(), key))
+                db.commit()
+                return row[0]
+        except (sqlite3.Error, OSError):
+            return None
+
+    def put(self, key: str, text: str) -> None:
+        try:
+            with self._lock:
+                db = self._db()
+                db.execute("INSERT OR REPLACE INTO llm_cache (key, text, atime) VALUES (?, ?, ?)", (key, text, time.time()))
+                db.execute(
+                    "DELETE FROM llm_cache WHERE key NOT IN (SELECT key FROM llm_cache ORDER BY atime DESC LIMIT ?)",
+                    (self.capacity,),
+                )
+                db.commit()
+        except (sqlite3.Error, OSError):
+            pass
+
+
+# 温度高于此值的调用视为随机采样，不读写缓存
+_CACHE_MAX_TEMPERATURE = 0.3
+
+
+def _llm_cache_key(prompt: str, kwargs: Dict[str, Any]) -> str | None:
+    """返回缓存键并从 kwargs 中取走 cacheable；cacheable=False 或温度过高时返回 None（不走缓存）。"""
+    if not kwargs.pop("cacheable", True):
+        return None
+    llm_config = get_llm_config()
+    temperature = kwargs.get("temperature", llm_config.temperature)
+    try:
+        if float(temperature) > _CACHE_MAX_TEMPERATURE:
+            return None
+    except (TypeError, ValueError):
+        return None
+    max_tokens = kwargs.get("max_tokens", llm_config.max_tokens)
+    model = _resolve_model(kwargs.get("tier", "strong"))
+    raw = f"{kwargs.get('system') or ''}|{prompt}|T={temperature}|M={max_tokens}|{model}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def lru_cached_llm(
+    capacity: int = 4096,
+    cache: _LLMCache | None = None,
+    disk: _DiskLLMCache | None = None,
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    为 LLM 调用函数加一层精确匹配的 LRU 缓存（同步/异步函数均可）。
+
+    键为 sha256(system + prompt + 温度 + max_tokens + 模型名)；相同提示词直接返回上次的响应，
+    省掉一整次网络往返。空响应不缓存；温度高于 0.3 或传入 cacheable=False 时直接调用。
+    传入 cache 可让多个包装函数共享同一份缓存；传入 disk 时内存未命中再查磁盘缓存，命中后回填内存。
+    包装后的函数提供 cache_stats()/cache_clear()。
+    """
+
+    def _decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        store = cache if cache is not None else _LLMCache(capacity)
+
+        def _lookup(key: str) -> str | None:
+            text = store.get(key)
+            if text is None and disk is not None:
+                text = disk.get(key)
+                if text is not None:
+                    store.put(key, text)
+            return text
+
+        def _remember(key: str, text: str) -> None:
+            store.put(key, text)
+            if disk is not None:
+                disk.put(key, text)
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(prompt: str, **kwargs) -> str:
+                key = _llm_cache_key(prompt, kwargs)
+                if key is None:
+                    return await func(prompt, **kwargs)
+                text = _lookup(key)
+                if text is not None:
+                    return text
+                text = await func(prompt, **kwargs)
+                if text:
+                    _remember(key, text)
+                return text
+        else:
+            @functools.wraps(func)
+            def wrapper(prompt: str, **kwargs) -> str:
+                key = _llm_cache_key(prompt, kwargs)
+                if key is None:
+                    return func(prompt, **kwargs)
+                text = _lookup(key)
+                if text is not None:
+                    return text
+                text = func(prompt, **kwargs)
+                if text:
+                    _remember(key, text)
+                return text
+
+        wrapper.cache_stats = store.stats  # type: ignore[attr-defined]
+        wrapper.cache_clear = store.clear  # type: ignore[attr-defined]
+        return wrapper
+
+    return _decorator
+
+
+# 带缓存的入口共享一份缓存：用于 ReAct / 决策 / 观察等可能重复发送相同提示词的调用点。
+# stop 条件不参与缓存键：流式入口只用于各自专用的提示词（如 ReAct），不会与完整响应串用。
+# LLM_DISK_CACHE=1 时再叠加一层 sqlite 磁盘缓存（.setupagent/llm_cache.db），跨进程复用。
+_llm_cache = _LLMCache(4096)
+_llm_disk_cache = (
+    _DiskLLMCache(Path(".setupagent") / "llm_cache.db", 2048) if os.environ.get("LLM_DISK_CACHE", "0") == "1" else None
+)
+_cached_llm = lru_cached_llm(cache=_llm_cache, disk=_llm_disk_cache)
+cached_llm_completion = _cached_llm(llm_completion)
+cached_llm_acompletion = _cached_llm(llm_acompletion)
+cached_llm_completion_streamed = _cached_llm(llm_completion_streamed)
+cached_llm_acompletion_streamed = _cached_llm(llm_acompletion_streamed)
+
+
+def llm_cache_stats() -> Dict[str, int]:
+    """返回带缓存 LLM 入口的命中/未命中/条目数统计。"""
+    return _llm_cache.stats()
+
+
 def _expand_repo_placeholders(path_str: str, repo_root: str) -> str:
     """Expand placeholders like repo_root/... or $env:REPO_ROOT/... into absolute paths.
 